@@ -23,10 +23,103 @@ else:
     ENABLE_TRANSFORMERS = False
 
 if ENV == "dev":
-    GEOIP_COUNTRY_DB = "./GeoLite2-Country.mmdb"
     GEOIP_CITY_DB = "./GeoLite2-City.mmdb"
 elif ENV == "prod":
-    GEOIP_COUNTRY_DB = "/opt/GeoLite2-Country.mmdb"
     GEOIP_CITY_DB = "/opt/GeoLite2-City.mmdb"
 else:
-    raise RuntimeError("ENV variable must be set to 'prod' or 'dev' to locate GeoIP databases")
\ No newline at end of file
+    raise RuntimeError("ENV variable must be set to 'prod' or 'dev' to locate the GeoIP database")
+
+# Seconds between polls of the `files` directory for new downloads (0 = off)
+FILES_WATCH_INTERVAL = float(os.getenv("FILES_WATCH_INTERVAL", "0"))
+
+# Worker processes for corpus ingestion (0 = one per CPU core)
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", "0")) or (os.cpu_count() or 1)
+
+# Vector index for semantic search: "flat" (exact) or "ivf" (approximate)
+VECTOR_INDEX = os.getenv("VECTOR_INDEX", "flat")
+if VECTOR_INDEX not in ["flat", "ivf"]:
+    raise RuntimeError("VECTOR_INDEX must be set to 'flat' or 'ivf'")
+# IVF clusters (0 = about 4 * sqrt(corpus size)) and clusters scanned per query
+IVF_NLIST = int(os.getenv("IVF_NLIST", "0"))
+IVF_NPROBE = int(os.getenv("IVF_NPROBE", "8"))
+# Quantized first-pass scan for semantic search: "none", "int8" or "binary",
+# rescoring VECTOR_RESCORE * top_k shortlisted documents with float vectors.
+# int8 saves memory but scans slower than float32; binary is also faster
+VECTOR_QUANTIZATION = os.getenv("VECTOR_QUANTIZATION", "none")
+if VECTOR_QUANTIZATION not in ["none", "int8", "binary"]:
+    raise RuntimeError("VECTOR_QUANTIZATION must be set to 'none', 'int8' or 'binary'")
+VECTOR_RESCORE = int(os.getenv("VECTOR_RESCORE", "8"))
+
+# Keep the BGE-M3 lexical weights of the corpus (from the same encoding pass
+# as the dense vectors) in posting lists for learned-sparse search (opt-in)
+SPARSE_INDEX = os.getenv("SPARSE_INDEX", "0").lower() in ["1", "true", "yes"]
+
+# Query embedding cache: entries kept in memory (0 = off), seconds before an
+# entry expires (0 = never) and whether to also persist embeddings in SQLite
+QUERY_CACHE_SIZE = int(os.getenv("QUERY_CACHE_SIZE", "1024"))
+QUERY_CACHE_TTL = float(os.getenv("QUERY_CACHE_TTL", "0"))
+QUERY_CACHE_PERSIST = os.getenv("QUERY_CACHE_PERSIST", "0").lower() in ["1", "true", "yes"]
+
+# Finished /search results kept per worker, keyed on the index generation
+RESULT_CACHE_SIZE = int(os.getenv("RESULT_CACHE_SIZE", "256"))
+
+# Micro-batching of concurrent query encodings: maximum batch size (1 = off)
+# and milliseconds to wait for more queries after the first one arrives
+QUERY_BATCH_SIZE = int(os.getenv("QUERY_BATCH_SIZE", "16"))
+QUERY_BATCH_WAIT_MS = float(os.getenv("QUERY_BATCH_WAIT_MS", "5"))
+
+# Thread pools of the async endpoints: ranking runs on SEARCH_WORKERS threads
+# and database access on DB_WORKERS threads. Jobs beyond workers + queue are
+# rejected with 503 and a Retry-After of RETRY_AFTER seconds.
+SEARCH_WORKERS = int(os.getenv("SEARCH_WORKERS", "0")) or (os.cpu_count() or 1)
+SEARCH_QUEUE = int(os.getenv("SEARCH_QUEUE", "32"))
+DB_WORKERS = int(os.getenv("DB_WORKERS", "2"))
+DB_QUEUE = int(os.getenv("DB_QUEUE", "64"))
+RETRY_AFTER = int(os.getenv("RETRY_AFTER", "1"))
+
+# Write-behind query logging: seconds between flushes, buffered rows that
+# force a flush, and QueryLog IDs reserved per database round trip
+QUERY_LOG_FLUSH_INTERVAL = float(os.getenv("QUERY_LOG_FLUSH_INTERVAL", "1"))
+QUERY_LOG_BATCH = int(os.getenv("QUERY_LOG_BATCH", "100"))
+QUERY_LOG_ID_BLOCK = int(os.getenv("QUERY_LOG_ID_BLOCK", "1000"))
+# Failed flushes of a query log row before it is dead-lettered, and dead
+# rows kept in memory per worker
+QUERY_LOG_ATTEMPTS = int(os.getenv("QUERY_LOG_ATTEMPTS", "3"))
+QUERY_LOG_DEAD_LETTER = int(os.getenv("QUERY_LOG_DEAD_LETTER", "1000"))
+
+# Query/feedback store: SQLAlchemy URL, connection pool per worker and, for
+# SQLite, milliseconds a writer waits for the database lock
+DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./queries.db")
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+
+# GeoIP: memory-map the .mmdb file instead of the reader's default mode,
+# locations cached per IP (or per /24 and /48 network with the prefix option)
+# and whether the lookup runs in the background query logger
+GEOIP_MMAP = os.getenv("GEOIP_MMAP", "0").lower() in ["1", "true", "yes"]
+GEOIP_CACHE_SIZE = int(os.getenv("GEOIP_CACHE_SIZE", "4096"))
+GEOIP_CACHE_PREFIX = os.getenv("GEOIP_CACHE_PREFIX", "0").lower() in ["1", "true", "yes"]
+GEOIP_BACKGROUND = os.getenv("GEOIP_BACKGROUND", "1").lower() in ["1", "true", "yes"]
+
+# Bytes copied at a time when an upload is streamed to disk
+UPLOAD_CHUNK_SIZE = int(os.getenv("UPLOAD_CHUNK_SIZE", str(1 << 20)))
+
+# Hybrid search: "rrf" fuses the BM25 and dense rankings with reciprocal rank
+# fusion, "rerank" scores the BM25 candidates with the dense embeddings.
+# HYBRID_CANDIDATES documents are taken from each ranking, RRF uses
+# 1 / (HYBRID_RRF_K + rank) weighted per retriever
+HYBRID_FUSION = os.getenv("HYBRID_FUSION", "rrf")
+if HYBRID_FUSION not in ["rrf", "rerank"]:
+    raise RuntimeError("HYBRID_FUSION must be set to 'rrf' or 'rerank'")
+HYBRID_CANDIDATES = int(os.getenv("HYBRID_CANDIDATES", "100"))
+HYBRID_RRF_K = int(os.getenv("HYBRID_RRF_K", "60"))
+HYBRID_BM25_WEIGHT = float(os.getenv("HYBRID_BM25_WEIGHT", "1"))
+HYBRID_DENSE_WEIGHT = float(os.getenv("HYBRID_DENSE_WEIGHT", "1"))
+
+# Structured warnings on the search path (e.g. a hit without a snippet) are
+# logged at most LOG_RATE_LIMIT times per event kind every LOG_RATE_INTERVAL
+# seconds; the number of suppressed events is reported with the next one
+LOG_RATE_LIMIT = int(os.getenv("LOG_RATE_LIMIT", "10"))
+LOG_RATE_INTERVAL = float(os.getenv("LOG_RATE_INTERVAL", "60"))
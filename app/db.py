@@ -1,12 +1,73 @@
 # Copyright 2025 Leon Hecht
 # Licensed under the Apache License, Version 2.0 (see LICENSE file)
 
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+from sqlalchemy.pool import QueuePool, StaticPool
 from sqlmodel import SQLModel, create_engine
 
+from app.config import DATABASE_URL, DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_POOL_TIMEOUT, SQLITE_BUSY_TIMEOUT_MS
 # import every model so SQLModel.metadata knows about them
-from app.models.query_log import QueryLog
+from app.models.query_log import QueryLog, QueryLogSequence
 from app.models.feedback  import Feedback
 
 
-engine = create_engine("sqlite:///./queries.db", echo=False)
-SQLModel.metadata.create_all(engine)
\ No newline at end of file
+def _sqlite_pragmas(busy_timeout_ms: int):
+    """
+    Connection hook tuning SQLite for concurrent workers.
+
+    WAL lets readers run alongside the single writer, synchronous=NORMAL
+    syncs at checkpoints instead of every commit (safe in WAL mode), and
+    the busy timeout makes a writer wait for the lock instead of failing
+    with "database is locked".
+    """
+    def on_connect(dbapi_conn, connection_record):
+        cursor = dbapi_conn.cursor()
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.execute(f"PRAGMA busy_timeout={int(busy_timeout_ms)}")
+        cursor.close()
+    return on_connect
+
+
+def create_db_engine(url: str = DATABASE_URL, pool_size: int = DB_POOL_SIZE,
+                     max_overflow: int = DB_MAX_OVERFLOW, pool_timeout: float = DB_POOL_TIMEOUT,
+                     busy_timeout_ms: int = SQLITE_BUSY_TIMEOUT_MS):
+    """
+    Create the engine for the query/feedback store.
+
+    The pool settings only apply to dialects pooled with ``QueuePool``.
+    In-memory SQLite shares a single connection between all threads,
+    since each connection would otherwise see its own empty database.
+
+    Parameters
+    ----------
+    url : str
+        SQLAlchemy database URL.
+    pool_size : int
+        Connections kept open per worker process.
+    max_overflow : int
+        Extra connections allowed under bursts.
+    pool_timeout : float
+        Seconds to wait for a free connection.
+    busy_timeout_ms : int
+        SQLite only: milliseconds to wait for the database lock.
+    """
+    kwargs = {}
+    if url.startswith("sqlite"):
+        # connections move between the pool threads; the driver waits for
+        # the lock up to the busy timeout
+        kwargs["connect_args"] = {"check_same_thread": False, "timeout": busy_timeout_ms / 1000}
+    parsed = make_url(url)
+    if parsed.get_backend_name() == "sqlite" and parsed.database in (None, "", ":memory:"):
+        kwargs["poolclass"] = StaticPool
+    elif issubclass(parsed.get_dialect().get_pool_class(parsed), QueuePool):
+        kwargs.update(pool_size=pool_size, max_overflow=max_overflow, pool_timeout=pool_timeout)
+    engine = create_engine(url, echo=False, pool_pre_ping=True, **kwargs)
+    if engine.dialect.name == "sqlite":
+        event.listen(engine, "connect", _sqlite_pragmas(busy_timeout_ms))
+    return engine
+
+
+engine = create_db_engine()
+SQLModel.metadata.create_all(engine)
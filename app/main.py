@@ -2,22 +2,49 @@
 # Licensed under the Apache License, Version 2.0 (see LICENSE file)
 
 import os
-from fastapi import FastAPI
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
 from fastapi.staticfiles import StaticFiles
 
 from app.routers import search
 from app.routers import upload
 from app.routers import feedback
+from app.routers import metrics
 from app.config import CORPUS_PATH
 from app.models.query_log import QueryLog
 from app.models.feedback import Feedback
 from app.db import engine
+from app.services.executors import Overloaded
+from app.services.metrics import REJECTED
+from app.services.query_logger import QUERY_LOGGER
 
-app = FastAPI(title="Legal Search App")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    yield
+    # write the query log rows still buffered in memory
+    QUERY_LOGGER.close()
+
+
+app = FastAPI(title="Legal Search App", lifespan=lifespan)
 
 app.include_router(search.router)
 app.include_router(upload.router)
 app.include_router(feedback.router)
+app.include_router(metrics.router)
+
+
+@app.exception_handler(Overloaded)
+async def overloaded_handler(request: Request, exc: Overloaded):
+    """Shed load with 503 instead of queueing requests without bound."""
+    REJECTED.inc(exc.pool)
+    return JSONResponse(
+        status_code=503,
+        content={"detail": f"Server busy ({exc.pool}), retry later"},
+        headers={"Retry-After": str(exc.retry_after)},
+    )
+
 
 # Serve anything in your corpus folder at `/files/<filename>`
 app.mount(
@@ -10,5 +10,16 @@ class QueryLog(SQLModel, table=True):
     city: str | None = Field(default=None, index=True)  # e.g. "Asuncion"
     timestamp: datetime = Field(default_factory=datetime.now)
     client_ip: str
-    mode: str            # "exacta" or "semantica"
-    query: str
\ No newline at end of file
+    mode: str            # "exacta", "semantica", "hibrida" or "dispersa"
+    query: str
+
+
+class QueryLogSequence(SQLModel, table=True):
+    """
+    Next unused QueryLog ID, handed out to workers in blocks.
+
+    Reserving a block of IDs in one transaction lets a worker assign IDs to
+    new QueryLog rows before they are written.
+    """
+    name: str = Field(primary_key=True)
+    next_id: int
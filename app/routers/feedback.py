@@ -6,7 +6,10 @@ from sqlmodel import Session, select
 from pydantic import BaseModel, Field
 from app.models.feedback import Feedback
 from app.models.query_log import QueryLog
+from app.config import RETRY_AFTER
 from app.db import engine
+from app.services.executors import DB_EXECUTOR
+from app.services.query_logger import QUERY_LOGGER
 
 router = APIRouter()
 
@@ -20,16 +23,23 @@ class FeedbackRequest(BaseModel):
     positive: bool = Field(..., description="True=Like, False=Dislike")
 
 
-@router.post("/feedback", summary="Submit like/dislike feedback")
-async def submit_feedback(
-    request: Request,
-    fb: FeedbackRequest = Body(...),
-) -> dict:
-    # Optional: you could re-derive client IP if you care
+def _store_feedback(fb: FeedbackRequest) -> int | None:
+    """Insert the feedback; None if the referenced QueryLog does not exist."""
+    # the QueryLog row may still be buffered; write it before referencing it
+    if QUERY_LOGGER.is_pending(fb.query_log_id):
+        QUERY_LOGGER.flush()
     with Session(engine) as session:
         # ensure the referenced QueryLog exists
         if not session.exec(select(QueryLog).where(QueryLog.id == fb.query_log_id)).first():
-            raise HTTPException(status_code=404, detail="QueryLog not found")
+            if QUERY_LOGGER.issued(fb.query_log_id):
+                # handed out by some worker, but not written yet or the
+                # write failed
+                raise HTTPException(
+                    status_code=503,
+                    detail="QueryLog could not be written yet",
+                    headers={"Retry-After": str(RETRY_AFTER)},
+                )
+            return None
 
         new_fb = Feedback(
             query_log_id=fb.query_log_id,
@@ -39,5 +49,18 @@ async def submit_feedback(
         session.add(new_fb)
         session.commit()
         session.refresh(new_fb)
+        return new_fb.id
+
+
+@router.post("/feedback", summary="Submit like/dislike feedback")
+async def submit_feedback(
+    request: Request,
+    fb: FeedbackRequest = Body(...),
+) -> dict:
+    # Optional: you could re-derive client IP if you care
+    # the blocking database work runs on the database pool
+    feedback_id = await DB_EXECUTOR.run(_store_feedback, fb)
+    if feedback_id is None:
+        raise HTTPException(status_code=404, detail="QueryLog not found")
 
-    return {"status": "ok", "feedback_id": new_fb.id}
+    return {"status": "ok", "feedback_id": feedback_id}
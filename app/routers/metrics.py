@@ -0,0 +1,20 @@
+# Copyright 2025 Leon Hecht
+# Licensed under the Apache License, Version 2.0 (see LICENSE file)
+
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+
+from app.services import metrics
+
+router = APIRouter()
+
+
+@router.get("/metrics", response_class=PlainTextResponse, summary="Search metrics in Prometheus text format")
+def metrics_endpoint():
+    """
+    Per-stage latency histograms and counters of this worker process.
+
+    With several uvicorn workers, a scrape reports the worker that
+    answered it.
+    """
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
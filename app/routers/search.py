@@ -1,17 +1,21 @@
 # Copyright 2025 Leon Hecht
 # Licensed under the Apache License, Version 2.0 (see LICENSE file)
 
-from typing import List
+import time
+from typing import List, Literal
 
 from fastapi import APIRouter, HTTPException, Body, Request
 from pydantic import BaseModel, Field
-from sqlmodel import Session
 
 from app.services.bm25 import bm25_search
-from app.services.transformer import transformer_search
-from app.models.query_log import QueryLog
-from app.services.utils import country_from_ip, city_from_ip
-from app.db import engine
+from app.services.transformer import transformer_search, sparse_search, query_cache_stats
+from app.services.hybrid import hybrid_search
+from app.services.cache import RESULT_CACHE
+from app.services.executors import SEARCH_EXECUTOR, DB_EXECUTOR, Overloaded
+from app.services.metrics import REQUEST_SECONDS, REQUESTS
+from app.services.query_logger import QUERY_LOGGER
+from app.services.utils import locate_ip
+from app.config import GEOIP_BACKGROUND, SPARSE_INDEX
 
 router = APIRouter()
 
@@ -21,6 +25,17 @@ class SearchRequest(BaseModel):
     query: str
     top_k: int = 30
     use_transformer: bool = False
+    # overrides use_transformer when given
+    mode: Literal["bm25", "transformer", "hybrid", "sparse"] | None = None
+
+
+# search function and QueryLog.mode value of each search mode
+_SEARCH_MODES = {
+    "bm25": (bm25_search, "exacta"),
+    "transformer": (transformer_search, "semantica"),
+    "hybrid": (hybrid_search, "hibrida"),
+    "sparse": (sparse_search, "dispersa"),
+}
 
 
 class SearchResult(BaseModel):
@@ -52,43 +67,72 @@ def ping():
     return {"message": "pong"}
 
 
-@router.post("/search", response_model=SearchResponse, summary="Run a BM25 or transformer search")
-def search_endpoint(request: Request, req: SearchRequest = Body(..., description="Your search parameters")) -> SearchResponse:
+@router.get("/cache/stats", summary="Hit/miss counters of the search caches")
+def cache_stats():
+    return {"query_embeddings": query_cache_stats(), "results": RESULT_CACHE.stats()}
+
+
+def _log_query(client_ip: str, mode: str, query: str) -> int:
+    """Buffer a QueryLog row (with the client's location) and return its ID."""
+    if GEOIP_BACKGROUND:
+        # the query logger looks up the location before writing the row
+        return QUERY_LOGGER.log(client_ip=client_ip, mode=mode, query=query)
+    country, city = locate_ip(client_ip)
+    return QUERY_LOGGER.log(
+        client_ip=client_ip,
+        country=country or "Unknown",
+        city=city or "Unknown",
+        mode=mode,
+        query=query,
+    )
+
+
+@router.post("/search", response_model=SearchResponse, summary="Run a BM25, transformer, hybrid or sparse search")
+async def search_endpoint(request: Request, req: SearchRequest = Body(..., description="Your search parameters")) -> SearchResponse:
     """
     Execute a search and log the query.
 
     1. Validates non-empty query.
-    2. Captures client IP, country, and city.
-    3. Inserts a QueryLog row and retrieves its ID.
-    4. Runs either BM25 or transformer search.
+    2. Captures client IP, country, and city (the location is looked up
+       in the background unless GEOIP_BACKGROUND is off).
+    3. Runs BM25, transformer, hybrid or learned-sparse search (on the
+       search pool); ``mode`` picks the search, else ``use_transformer``.
+    4. Buffers a QueryLog row with a pre-allocated ID, also when the
+       search failed; rows are written to the database in batches by the
+       query logger.
     5. Returns the log ID along with the hits.
+
+    Responds with 503 and a Retry-After header when either pool is full;
+    room in both pools is taken up front, so a rejected request neither
+    searches nor is logged.
     """
     if not req.query.strip():
         raise HTTPException(status_code=400, detail="Query must not be empty")
     
+    if req.mode == "sparse" and not SPARSE_INDEX:
+        raise HTTPException(status_code=400, detail="Sparse search is disabled (SPARSE_INDEX=0)")
+
+    start = time.perf_counter()
     client_ip = request.client.host or "Unknown"
-    country   = country_from_ip(client_ip) or "Unknown"
-    city      = city_from_ip(client_ip) or "Unknown"
-    
-    # 1) Log the search
-    with Session(engine) as sess:
-        log = QueryLog(
-            client_ip=client_ip,
-            country=country,
-            city=city,
-            mode="semantica" if req.use_transformer else "exacta",
-            query=req.query.strip(),
-        )
-        sess.add(log)
-        sess.commit()
-        sess.refresh(log)  # populates log.id
-
-    # 2) Run the actual search  
-    if req.use_transformer:
-        hits = transformer_search(req.query, top_k=req.top_k)
-    else:
-        # existing BM25 search returns full results
-        hits = bm25_search(req.query, top_k=req.top_k)
-    
+    search, mode = _SEARCH_MODES[req.mode or ("transformer" if req.use_transformer else "bm25")]
+
+    # reserve both pools before running anything, so Overloaded from
+    # either one rejects the whole request
+    SEARCH_EXECUTOR.reserve()
+    try:
+        DB_EXECUTOR.reserve()
+    except Overloaded:
+        SEARCH_EXECUTOR.release()
+        raise
+
+    # 1) Run the actual search and 2) log it (write-behind), off the event
+    # loop; accepted queries are logged even if the search fails
+    try:
+        hits = await SEARCH_EXECUTOR.run_reserved(search, req.query, top_k=req.top_k)
+    finally:
+        log_id = await DB_EXECUTOR.run_reserved(_log_query, client_ip, mode, req.query.strip())
+    REQUEST_SECONDS.observe(time.perf_counter() - start, mode)
+    REQUESTS.inc(mode)
+
     # 3) Return both the log ID and the results
-    return SearchResponse(query_log_id=log.id, results=hits)
\ No newline at end of file
+    return SearchResponse(query_log_id=log_id, results=hits)
@@ -1,18 +1,50 @@
 # Copyright 2025 Leon Hecht
 # Licensed under the Apache License, Version 2.0 (see LICENSE file)
 
+import os
+import shutil
+import uuid
 from fastapi import APIRouter, UploadFile, File, HTTPException
 from pathlib import Path
-from app.config import CORPUS_PATH, ENABLE_TRANSFORMERS
-from app.services.bm25 import load_corpus
+from app.config import CORPUS_PATH, ENABLE_TRANSFORMERS, UPLOAD_CHUNK_SIZE
+from app.services.bm25 import index_files
+from app.services.files import refresh_files
+from app.services.jobs import JobQueue
+from app.services.snapshot import snapshot_root
 
 router = APIRouter()
 
-@router.post("/upload")
+# uploads are indexed one after another in the background; their status
+# is shared with the other workers through the index directory
+_INDEX_JOBS = JobQueue("index-uploads", status_dir=snapshot_root(CORPUS_PATH) / "jobs")
+
+
+def _save_upload(file: UploadFile, dest: Path):
+    """Stream an upload to ``dest`` in chunks; readers never see a partial file."""
+    tmp = dest.with_name(f".{dest.name}.{uuid.uuid4().hex[:8]}.part")
+    try:
+        with open(tmp, "wb") as f:
+            shutil.copyfileobj(file.file, f, UPLOAD_CHUNK_SIZE)
+        os.replace(tmp, dest)
+    except BaseException:
+        tmp.unlink(missing_ok=True)
+        raise
+
+
+def _index_uploads(paths: list[Path]) -> str:
+    index_files(paths)
+    refresh_files()
+    return f"Indexed {len(paths)} uploaded files."
+
+
+@router.post("/upload", status_code=202)
 def upload_files(files: list[UploadFile] = File(...)):
     """
     Upload a JSONL corpus or multiple TXT files. Only allowed in public mode.
-    After upload, rebuild BM25 index.
+
+    Files are streamed to disk and indexed by a background job: the files
+    are added to the BM25 index (a JSONL corpus is re-indexed). Poll
+    ``/upload/jobs/{job_id}`` for the job status.
     """
     if ENABLE_TRANSFORMERS:
         raise HTTPException(status_code=403, detail="Upload not allowed in thesis mode")
@@ -20,13 +52,30 @@ def upload_files(files: list[UploadFile] = File(...)):
     upload_dir = Path(CORPUS_PATH)
     upload_dir.mkdir(parents=True, exist_ok=True)
     saved = []
+    paths = []
     for file in files:
-        filename = file.filename
+        # never write outside the corpus folder
+        filename = Path(file.filename or "").name
+        if not filename:
+            raise HTTPException(status_code=400, detail="Uploaded file has no name")
         dest = upload_dir / filename
-        with open(dest, "wb") as f:
-            f.write(file.file.read())
+        _save_upload(file, dest)
         saved.append(filename)
+        paths.append(dest)
+
+    # Update BM25 with the uploaded documents in the background
+    job = _INDEX_JOBS.submit(f"Index {', '.join(saved)}", _index_uploads, paths)
+    return {
+        "uploaded_files": saved,
+        "job_id": job.id,
+        "status_url": f"/upload/jobs/{job.id}",
+        "detail": "Files stored; BM25 indexing runs in the background.",
+    }
+
 
-    # Reload BM25 with updated corpus
-    load_corpus()
-    return {"uploaded_files": saved, "detail": "Corpus updated and BM25 indexed."}
\ No newline at end of file
+@router.get("/upload/jobs/{job_id}", summary="Status of an upload indexing job")
+def upload_job_status(job_id: str):
+    job = _INDEX_JOBS.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
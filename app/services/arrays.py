@@ -0,0 +1,17 @@
+# Copyright 2025 Leon Hecht
+# Licensed under the Apache License, Version 2.0 (see LICENSE file)
+
+"""Helpers for the ``.npy`` files of the on-disk caches."""
+
+import os
+from pathlib import Path
+
+import numpy as np
+
+
+def save_npy(path: Path, array: np.ndarray):
+    """Write ``array`` to ``path`` atomically, so readers never map a partial file."""
+    tmp = path.with_name(path.name + ".tmp")
+    with open(tmp, "wb") as f:
+        np.save(f, array)
+    os.replace(tmp, path)
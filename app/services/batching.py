@@ -0,0 +1,99 @@
+# Copyright 2025 Leon Hecht
+# Licensed under the Apache License, Version 2.0 (see LICENSE file)
+
+"""
+Micro-batching of concurrent model calls.
+
+Encoding one query at a time leaves most of a transformer's CPU throughput
+unused. ``MicroBatcher`` runs a single background thread that takes the
+first pending item, keeps collecting items for at most ``max_wait``
+seconds or until ``max_batch`` are queued, encodes the whole batch in one
+call and hands every result back to its caller through a
+``concurrent.futures.Future``. Identical items in a batch are encoded once.
+"""
+
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Callable, Sequence
+
+
+class MicroBatcher:
+    """
+    Collect concurrent requests into batches for ``encode``.
+
+    Parameters
+    ----------
+    encode : Callable[[list], Sequence]
+        Encodes a list of items and returns one result per item, in order.
+    max_batch : int
+        Maximum number of distinct items per call to ``encode``.
+    max_wait : float
+        Seconds to wait for more items after the first one arrives.
+    name : str
+        Name of the worker thread.
+    """
+
+    def __init__(self, encode: Callable[[list], Sequence], max_batch: int = 16,
+                 max_wait: float = 0.005, name: str = "micro-batcher"):
+        self.encode = encode
+        self.max_batch = max(1, max_batch)
+        self.max_wait = max_wait
+        self._queue: queue.SimpleQueue[tuple[object, Future]] = queue.SimpleQueue()
+        self.batches = 0
+        self.items = 0
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+
+    def submit(self, item) -> Future:
+        """Queue ``item`` and return a future for its encoding."""
+        future: Future = Future()
+        self._queue.put((item, future))
+        return future
+
+    def __call__(self, item):
+        """Encode ``item`` as part of the next batch and wait for the result."""
+        return self.submit(item).result()
+
+    def _collect(self) -> dict[object, list[Future]]:
+        item, future = self._queue.get()
+        pending = {item: [future]}
+        deadline = time.monotonic() + self.max_wait
+        while len(pending) < self.max_batch:
+            # after the deadline, still take what is already queued
+            timeout = deadline - time.monotonic()
+            try:
+                if timeout > 0:
+                    item, future = self._queue.get(timeout=timeout)
+                else:
+                    item, future = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            pending.setdefault(item, []).append(future)
+        return pending
+
+    def _run(self):
+        while True:
+            pending = self._collect()
+            items = list(pending)
+            try:
+                results = self.encode(items)
+            except Exception as exc:
+                for futures in pending.values():
+                    for future in futures:
+                        future.set_exception(exc)
+                continue
+            self.batches += 1
+            self.items += len(items)
+            for item, result in zip(items, results):
+                for future in pending[item]:
+                    future.set_result(result)
+
+    def stats(self) -> dict:
+        """Number of batches encoded and their mean size."""
+        return {
+            "batches": self.batches,
+            "items": self.items,
+            "mean_batch": self.items / self.batches if self.batches else 0.0,
+        }
@@ -1,83 +1,116 @@
 # Copyright 2025 Leon Hecht
 # Licensed under the Apache License, Version 2.0 (see LICENSE file)
 
-import json
+import logging
 from pathlib import Path
-from rank_bm25 import BM25Okapi
-from app.config import CORPUS_PATH
+from app.config import CORPUS_PATH, INGEST_WORKERS
+from app.services.ranking import top_k_indices
+from app.services.hits import build_hits, snippet_terms
+from app.services.snapshot import corpus_fingerprint, load_snapshot, save_snapshot
+from app.services.generation import IndexGeneration, id_positions, next_generation_number
+from app.services.snippets import SnippetIndex
+from app.services.normalize import normalize_token
+from app.services.ingest import ingest_corpus
+from app.services.cache import RESULT_CACHE
+from app.services.logs import log_event
+from app.services.metrics import stage
 from threading import Lock
-import unicodedata
-import re
 
 """
 Load a JSONL corpus file and initialize BM25 index.
 Expected JSONL format: one JSON object per line with keys 'id', 'title', and 'text'.
 """
 
+# _lock serializes writers only; searches read _GENERATION without locking
 _lock = Lock()
-_CORPUS = []
-_TOKENIZED = []
-_BM25 = None
+_GENERATION = IndexGeneration(0, [], None)
 
 
-# helper to strip accents
-def strip_accents(s: str) -> str:
-    return ''.join(
-        c for c in unicodedata.normalize('NFD', s)
-        if unicodedata.category(c) != 'Mn'
-    )
-
-
-# helper to normalize tokens: strip accents, lowercase, and drop non‐letters
-def normalize_token(tok: str) -> str:
-    tok = strip_accents(tok.lower())
-    return re.sub(r'[^a-zA-Z]', '', tok)
+def _read_txt(file: Path) -> tuple[dict, list[str]]:
+    text = file.read_text(encoding="utf-8")
+    return {"id": file.stem, "text": text}, text.split()
 
 
 def load_corpus():
-    """Load documents from CORPUS_PATH into BM25 index."""
+    """
+    Load documents from CORPUS_PATH into BM25 index.
+
+    The index is mapped from the on-disk snapshot when one exists for the
+    current corpus contents; otherwise the corpus is tokenized, indexed and
+    a fresh snapshot is written for the next start.
+    """
     print("Loading corpus and initializing BM25 index...")
-    global _CORPUS, _TOKENIZED, _BM25
+    global _GENERATION
     with _lock:
-        _CORPUS.clear()
-        _TOKENIZED.clear()
-        jsonl_file = Path(CORPUS_PATH) / "corpus.jsonl"
-        if jsonl_file.exists():
-            # Load JSONL format
-            with jsonl_file.open(encoding="utf-8") as f:
-                for line in f:
-                    try:
-                        obj = json.loads(line)
-                    except json.JSONDecodeError:
-                        continue
-                    
-                    doc_id = obj.get("id")
-                    
-                    title = obj.get("title", "")
-                    
-                    text = obj.get("text", "")
-                    
-                    content = f"{title} {text}".strip()
-                    tokens_norm = [normalize_token(w) for w in content.split()]
-
-                    _CORPUS.append({"id": doc_id, "title": title, "text": content})
-                    _TOKENIZED.append(tokens_norm)
-        else:
-            # Load .txt files in directory
-            dir_path = Path(CORPUS_PATH)
-            for file in dir_path.glob("**/*.txt"):
-                text = file.read_text(encoding="utf-8")
-                tokens = text.split()
-                _CORPUS.append({"id": file.stem, "text": text})
-                _TOKENIZED.append(tokens)
-        # Build BM25
-        if _TOKENIZED:
-            _BM25 = BM25Okapi(_TOKENIZED)
+        fingerprint = corpus_fingerprint(CORPUS_PATH)
+        snapshot = load_snapshot(CORPUS_PATH, fingerprint)
+        if snapshot is not None:
+            print("Using BM25 index snapshot.")
+            corpus, index, snippets = snapshot
         else:
-            _BM25 = None
+            # Parse, tokenize and build BM25 on all cores
+            corpus, index, offsets, raw = ingest_corpus(CORPUS_PATH, INGEST_WORKERS)
+            snippets = None
+            if corpus:
+                snippets = SnippetIndex.from_offsets(index, offsets, normalize_token if raw else None)
+                save_snapshot(CORPUS_PATH, fingerprint, corpus, index, snippets)
+            else:
+                index = None
+        _GENERATION = IndexGeneration(
+            next_generation_number(), corpus, index, snippets, fingerprint, id_positions(corpus),
+        )
         print("Done loading corpus and initializing BM25 index.")
 
 
+def current_generation() -> IndexGeneration:
+    """Return the currently published index generation."""
+    return _GENERATION
+
+
+def index_files(paths: list[Path]):
+    """
+    Add uploaded files to the BM25 index without rebuilding it.
+
+    New ``.txt`` documents are appended to the postings and documents with
+    the same id are tombstoned. A new ``corpus.jsonl`` replaces the whole
+    corpus and therefore triggers a full `load_corpus`. While a
+    ``corpus.jsonl`` exists, ``.txt`` files are not part of the corpus.
+
+    The new generation is built next to the current one, so searches keep
+    using the previous generation until the new one is published.
+    """
+    global _GENERATION
+    jsonl_file = Path(CORPUS_PATH) / "corpus.jsonl"
+    if _GENERATION.index is None or any(p.name == jsonl_file.name for p in paths):
+        load_corpus()
+        return
+    if jsonl_file.exists():
+        return
+
+    docs, tokenized = [], []
+    for file in dict.fromkeys(paths):
+        if file.suffix == ".txt":
+            doc, tokens = _read_txt(file)
+            docs.append(doc)
+            tokenized.append(tokens)
+    if not docs:
+        return
+
+    with _lock:
+        gen = _GENERATION
+        # copy, so the published generation keeps its own map
+        positions = dict(gen.positions)
+        replaced = sorted(i for doc_id in {doc["id"] for doc in docs} for i in positions.pop(doc_id, ()))
+        for i, doc in enumerate(docs, start=len(gen.corpus)):
+            positions.setdefault(doc["id"], []).append(i)
+        index = gen.index.add_documents(tokenized, deleted=replaced)
+        snippets = gen.snippets.extended(index, (doc["text"] for doc in docs), normalize_token)
+        _GENERATION = IndexGeneration(
+            next_generation_number(), gen.corpus + docs, index, snippets, positions=positions,
+        )
+    print(f"Indexed {len(docs)} uploaded documents, replaced {len(replaced)}.")
+
+
 def bm25_search(query: str, top_k: int = 30) -> list[dict]:
     """
     Perform BM25 search over the loaded corpus.
@@ -95,59 +128,29 @@ def bm25_search(query: str, top_k: int = 30) -> list[dict]:
       - snippet: first 100 words of the text
       - download_url: path under /files to fetch the original doc
     """
-    if _BM25 is None:
+    gen = _GENERATION
+    if gen.index is None:
         return []
     
-    tokenized_query = [normalize_token(t) for t in query.split() if t]
+    with stage("tokenize"):
+        tokenized_query = [normalize_token(t) for t in query.split() if t]
     if not tokenized_query:
-        print("Empty query after normalization, returning empty results.")
+        log_event("empty_query", logging.DEBUG, query=query)
         return []
-    print(f"Searching for query: {tokenized_query}")
-    scores = _BM25.get_scores(tokenized_query)
-    top_indices = sorted(range(len(scores)), key=lambda i: scores[i], reverse=True)
-    top_indices = [i for i in top_indices if scores[i] > 0][:top_k]
+    log_event("bm25_search", logging.DEBUG, terms=tokenized_query)
+    # identical queries against the same generation share their results
+    cache_key = ("exacta", tuple(tokenized_query), top_k, gen.number)
+    cached = RESULT_CACHE.get(cache_key)
+    if cached is not None:
+        return [dict(hit) for hit in cached]
+    with stage("score"):
+        scores = gen.index.get_scores(tokenized_query)
+    with stage("topk"):
+        top_indices = top_k_indices(scores, top_k)
     
-    results = []
-    tokenized_query_cleaned = [tok for tok in tokenized_query if len(tok) > 3]
-    if len(tokenized_query_cleaned) > 0:
-        tokenized_query = tokenized_query_cleaned
-        
-    for i in top_indices:
-        doc = _CORPUS[i]
-        text = doc["text"]
-
-        # find first exact match of any query term and take 50-word window
-        snippet = ""
-        doc_tokens = text.split()
-        for idx, orig_tok in enumerate(doc_tokens):
-            if normalize_token(orig_tok) in tokenized_query:
-                start = max(idx - 25, 0)
-                snippet_tokens = doc_tokens[start : start + 50]
-                snippet = " ".join(snippet_tokens)
-                break
-        
-        if snippet == "":
-            print(f"Warning: No snippet found for document ID {doc['id']}")
-            
-        # detect the actual file extension (pdf, html, docx, etc.)
-        file_url = None
-        for ext in (".pdf", ".PDF", ".htm", ".html", ".HTML", ".docx", ".doc", ".txt"):
-            candidate = Path(CORPUS_PATH) / "files" / f"{doc['id']}{ext}"
-            if candidate.exists():
-                file_url = f"/files/{candidate.name}"
-                break
-        if file_url is None:
-            print(f"Warning: No file found for document ID {doc['id']}")
-
-        title = doc.get("title") or ""
-        results.append({
-            "id": doc["id"],
-            "title": title,
-            "score": float(scores[i]),
-            "snippet": snippet,
-            "download_url": file_url,
-        })
-    return results
+    results = build_hits(gen, top_indices, scores[top_indices], snippet_terms(tokenized_query))
+    RESULT_CACHE.put(cache_key, results)
+    return [dict(hit) for hit in results]
 
 # Initial load at module import
 load_corpus()
\ No newline at end of file
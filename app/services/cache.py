@@ -0,0 +1,153 @@
+# Copyright 2025 Leon Hecht
+# Licensed under the Apache License, Version 2.0 (see LICENSE file)
+
+"""
+Bounded in-process caches for repeated queries.
+
+``LRUCache`` is a thread-safe mapping that evicts the least recently used
+entry once ``maxsize`` entries are stored and treats entries older than
+``ttl`` seconds as missing. It counts hits, misses and evictions so the
+effectiveness of a cache can be monitored.
+
+``EmbeddingStore`` is an optional persistent second tier for query
+embeddings: a small SQLite table shared by all workers and kept across
+restarts.
+
+``RESULT_CACHE`` holds finished search results. Its keys contain the index
+generation the results were computed from, so publishing a new generation
+invalidates every older entry; those are never hit again and age out.
+"""
+
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from collections.abc import Hashable
+from pathlib import Path
+
+import numpy as np
+
+from app.config import RESULT_CACHE_SIZE
+
+
+class LRUCache:
+    """
+    Thread-safe LRU cache with an optional time-to-live.
+
+    Parameters
+    ----------
+    maxsize : int
+        Maximum number of entries; 0 disables the cache.
+    ttl : float
+        Seconds an entry stays valid; 0 keeps entries until evicted.
+    """
+
+    def __init__(self, maxsize: int, ttl: float = 0.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: OrderedDict[Hashable, tuple[float, object]] = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get(self, key: Hashable, default=None):
+        """Return the cached value for ``key`` (and mark it as recently used)."""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None and self.ttl and time.monotonic() - entry[0] > self.ttl:
+                del self._data[key]
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key: Hashable, value):
+        """Store ``value`` under ``key``, evicting the oldest entries if full."""
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._data[key] = (time.monotonic(), value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self) -> dict:
+        """Size, capacity and hit/miss/eviction counters."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+
+class EmbeddingStore:
+    """
+    Persistent float32 vectors keyed by model and text, stored in SQLite.
+
+    Parameters
+    ----------
+    path : Path
+        SQLite database file; created if missing.
+    ttl : float
+        Seconds a stored vector stays valid; 0 keeps vectors forever.
+    """
+
+    def __init__(self, path: Path, ttl: float = 0.0):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=10, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            " model TEXT, text TEXT, created REAL, vector BLOB,"
+            " PRIMARY KEY (model, text))"
+        )
+        self._conn.commit()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, model: str, text: str) -> np.ndarray | None:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT created, vector FROM embeddings WHERE model = ? AND text = ?",
+                (model, text),
+            ).fetchone()
+            if row is None or (self.ttl and time.time() - row[0] > self.ttl):
+                self.misses += 1
+                return None
+            self.hits += 1
+        return np.frombuffer(row[1], dtype=np.float32)
+
+    def put(self, model: str, text: str, vector: np.ndarray):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO embeddings VALUES (?, ?, ?, ?)",
+                (model, text, time.time(), np.asarray(vector, dtype=np.float32).tobytes()),
+            )
+            self._conn.commit()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses}
+
+
+# (mode, normalized query, top_k, generation number) -> search results
+RESULT_CACHE = LRUCache(RESULT_CACHE_SIZE)
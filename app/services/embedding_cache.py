@@ -0,0 +1,199 @@
+# Copyright 2025 Leon Hecht
+# Licensed under the Apache License, Version 2.0 (see LICENSE file)
+
+"""
+On-disk cache of dense corpus embeddings.
+
+The cache lives in ``<CORPUS_PATH>/.index/embeddings`` and consists of
+
+- ``manifest.json``: model name, ``max_length``, embedding dimension, the
+  name of the current matrix file and one content hash per document,
+- ``embeddings-<token>.npy``: the float32 matrix, one row per document,
+- ``sparse-<token>.<array>.npy``: optionally, the BGE-M3 lexical weights
+  of the same documents as a `SparseIndex`, produced by the same encoding
+  pass.
+
+Workers map the files read-only, so the operating system shares a single
+copy between them. When the corpus changes only documents whose content
+hash is new are sent to the model; every other row is copied from the
+previous matrix. Enabling the lexical weights on a cache without them
+keeps the matrix and only adds the weights.
+"""
+
+import fcntl
+import hashlib
+import json
+import os
+import uuid
+from pathlib import Path
+from typing import Callable
+
+import numpy as np
+
+from app.services.arrays import save_npy
+from app.services.sparse_index import SparseIndex, SparseRows
+
+CACHE_VERSION = 1
+
+
+def content_hash(text: str) -> str:
+    """Stable hash of the exact text that is fed to the model."""
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=16).hexdigest()
+
+
+def _read_manifest(cache_dir: Path) -> dict | None:
+    try:
+        return json.loads((cache_dir / "manifest.json").read_text(encoding="utf-8"))
+    except (OSError, json.JSONDecodeError):
+        return None
+
+
+def _open_cached(cache_dir: Path, manifest: dict | None, model_name: str, max_length: int, sparse: bool):
+    """
+    Return ``(hashes, memmap, sparse index)`` of a compatible cache, else ``None``.
+
+    The sparse index is ``None`` unless ``sparse`` is set and the cache has one.
+    """
+    if (
+        manifest is None
+        or manifest.get("version") != CACHE_VERSION
+        or manifest.get("model") != model_name
+        or manifest.get("max_length") != max_length
+    ):
+        return None
+    try:
+        embs = np.load(cache_dir / manifest["file"], mmap_mode="r")
+    except (OSError, ValueError, KeyError):
+        return None
+    postings = None
+    if sparse and "sparse_index" in manifest:
+        try:
+            postings = SparseIndex.load(cache_dir / manifest["sparse_index"], len(embs))
+        except (OSError, ValueError):
+            pass
+    return manifest["doc_hashes"], embs, postings
+
+
+def load_embeddings(
+    cache_dir: Path,
+    texts: list[str],
+    model_name: str,
+    max_length: int,
+    encode: Callable,
+    sparse: bool = False,
+):
+    """
+    Return the embedding matrix for ``texts``, encoding only what is missing.
+
+    Parameters
+    ----------
+    cache_dir : Path
+        Directory of the cache.
+    texts : list[str]
+        Documents exactly as they are passed to the model.
+    model_name : str
+        Identity of the model; a different model invalidates the cache.
+    max_length : int
+        Truncation length used for encoding; part of the cache key.
+    encode : Callable
+        Encodes a batch of texts into a 2-d float array or, with
+        ``sparse``, into ``(dense array, lexical weights)`` where the
+        lexical weights are one ``{token id: weight}`` dict per text.
+    sparse : bool
+        Also cache the lexical weights. If the cache has none, the cached
+        texts are encoded once more for their weights only; the cached
+        embedding rows are kept.
+
+    Returns
+    -------
+    np.ndarray or tuple[np.ndarray, SparseIndex]
+        Read-only memory-mapped float32 matrix with one row per text and,
+        with ``sparse``, the memory-mapped posting lists of the lexical
+        weights of every text.
+    """
+    if not texts:
+        embs = np.zeros((0, 0), dtype=np.float32)
+        return (embs, SparseIndex.from_rows(SparseRows.from_rows([]))) if sparse else embs
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    hashes = [content_hash(t) for t in texts]
+
+    # one worker encodes while the others wait and then map its result
+    with open(cache_dir / "lock", "w") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        manifest = _read_manifest(cache_dir)
+        cached = _open_cached(cache_dir, manifest, model_name, max_length, sparse)
+        same_docs = cached is not None and cached[0] == hashes
+        if same_docs and (not sparse or cached[2] is not None):
+            return (cached[1], cached[2]) if sparse else cached[1]
+
+        rows: dict[str, int] = {}
+        if cached is not None:
+            rows = {h: i for i, h in enumerate(cached[0])}
+        missing = [i for i, h in enumerate(hashes) if h not in rows]
+        # without cached weights every text goes through the model once more,
+        # but only the embeddings of the missing ones are taken from it
+        to_encode = missing
+        if sparse and cached is not None and cached[2] is None:
+            to_encode = list(range(len(texts)))
+            print(f"Computing lexical weights of {len(texts)} documents "
+                  f"(embeddings of {len(texts) - len(missing)} cached).")
+        else:
+            print(f"Encoding {len(missing)} of {len(texts)} documents (others cached).")
+
+        new_embs = new_weights = None
+        if to_encode:
+            new_embs = encode([texts[i] for i in to_encode])
+            if sparse:
+                new_embs, new_weights = new_embs[0], SparseRows.from_weights(new_embs[1])
+            new_embs = np.asarray(new_embs, dtype=np.float32)
+        slots = {i: j for j, i in enumerate(to_encode)}
+        dim = new_embs.shape[1] if new_embs is not None else cached[1].shape[1]
+
+        if same_docs:
+            # only the lexical weights were missing: keep the matrix and the
+            # indexes derived from it
+            filename = manifest["file"]
+            token = filename.removeprefix("embeddings-").removesuffix(".npy")
+        else:
+            embs = np.empty((len(texts), dim), dtype=np.float32)
+            if missing:
+                embs[missing] = new_embs[[slots[i] for i in missing]]
+            reused = [i for i, h in enumerate(hashes) if h in rows]
+            if reused:
+                embs[reused] = cached[1][[rows[hashes[i]] for i in reused]]
+
+            # write the new files under a fresh name, then publish the manifest
+            token = uuid.uuid4().hex[:12]
+            filename = f"embeddings-{token}.npy"
+            save_npy(cache_dir / filename, embs)
+        new_manifest = {
+            "version": CACHE_VERSION,
+            "model": model_name,
+            "max_length": max_length,
+            "dim": int(dim),
+            "file": filename,
+            "doc_hashes": hashes,
+        }
+        if sparse:
+            old_rows = cached[2].to_rows() if cached is not None and cached[2] is not None else None
+            sparse_rows = SparseRows.from_rows([
+                new_weights.row(slots[i]) if i in slots else old_rows.row(rows[h])
+                for i, h in enumerate(hashes)
+            ])
+            new_manifest["sparse_index"] = f"sparse-{token}"
+            SparseIndex.from_rows(sparse_rows).save(cache_dir / new_manifest["sparse_index"])
+        tmp = cache_dir / "manifest.json.tmp"
+        tmp.write_text(json.dumps(new_manifest), encoding="utf-8")
+        os.replace(tmp, cache_dir / "manifest.json")
+
+        for old in cache_dir.glob("embeddings-*.npy"):
+            if old.name != filename:
+                old.unlink(missing_ok=True)
+        for old in cache_dir.glob("sparse-*"):
+            if not (sparse and old.name.startswith(f"sparse-{token}.")):
+                old.unlink(missing_ok=True)
+
+    embs = np.load(cache_dir / filename, mmap_mode="r")
+    if sparse:
+        return embs, SparseIndex.load(cache_dir / new_manifest["sparse_index"], len(embs))
+    return embs
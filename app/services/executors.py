@@ -0,0 +1,88 @@
+# Copyright 2025 Leon Hecht
+# Licensed under the Apache License, Version 2.0 (see LICENSE file)
+
+"""
+Bounded thread pools for blocking work called from async endpoints.
+
+Endpoints never block the event loop: ranking runs on the search pool,
+sized for CPU work, and database access runs on its own small pool so a
+slow SQLite write cannot hold up searches (or vice versa). Each pool
+accepts at most ``workers + max_queue`` jobs at a time; beyond that
+`BoundedExecutor.run` raises `Overloaded` immediately instead of letting
+requests pile up, and the application answers ``503`` with a
+``Retry-After`` header. A request that needs both pools takes its room in
+each with `BoundedExecutor.reserve` before starting either job, so it is
+rejected as a whole or not at all.
+"""
+
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+from app.config import SEARCH_WORKERS, SEARCH_QUEUE, DB_WORKERS, DB_QUEUE, RETRY_AFTER
+
+
+class Overloaded(Exception):
+    """Raised when a pool has no room for another job."""
+
+    def __init__(self, pool: str, retry_after: int):
+        super().__init__(f"{pool} pool is full")
+        self.pool = pool
+        self.retry_after = retry_after
+
+
+class BoundedExecutor:
+    """
+    Thread pool that rejects jobs instead of queueing them without limit.
+
+    Parameters
+    ----------
+    name : str
+        Pool name, used for thread names and in `Overloaded`.
+    workers : int
+        Number of worker threads.
+    max_queue : int
+        Jobs allowed to wait for a free worker.
+    retry_after : int
+        Seconds clients are asked to wait when the pool is full.
+    """
+
+    def __init__(self, name: str, workers: int, max_queue: int, retry_after: int = 1):
+        self.name = name
+        self.retry_after = retry_after
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix=name)
+        self._slots = threading.BoundedSemaphore(workers + max_queue)
+        self.rejected = 0
+
+    def reserve(self):
+        """Take room for one job, to be used by `run_reserved` or given back with `release`."""
+        if not self._slots.acquire(blocking=False):
+            self.rejected += 1
+            raise Overloaded(self.name, self.retry_after)
+
+    def release(self):
+        """Give back room taken by `reserve` that will not be used."""
+        self._slots.release()
+
+    async def run(self, fn, *args, **kwargs):
+        """Run ``fn(*args, **kwargs)`` on the pool and await its result."""
+        self.reserve()
+        return await self.run_reserved(fn, *args, **kwargs)
+
+    async def run_reserved(self, fn, *args, **kwargs):
+        """Like `run`, using room already taken with `reserve`."""
+        try:
+            future = self._pool.submit(partial(fn, *args, **kwargs))
+        except BaseException:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        return await asyncio.wrap_future(future)
+
+    def shutdown(self):
+        self._pool.shutdown(wait=True)
+
+
+SEARCH_EXECUTOR = BoundedExecutor("search", SEARCH_WORKERS, SEARCH_QUEUE, RETRY_AFTER)
+DB_EXECUTOR = BoundedExecutor("db", DB_WORKERS, DB_QUEUE, RETRY_AFTER)
@@ -0,0 +1,101 @@
+# Copyright 2025 Leon Hecht
+# Licensed under the Apache License, Version 2.0 (see LICENSE file)
+
+"""
+Doc-id -> downloadable file lookup.
+
+The ``files`` directory under CORPUS_PATH is scanned once and the result
+kept in a dict, so building search results does no filesystem I/O. The map
+is refreshed after uploads and, when ``FILES_WATCH_INTERVAL`` is set, by a
+background thread that rescans whenever the directory changes.
+"""
+
+import os
+import threading
+import time
+from pathlib import Path
+
+from app.config import CORPUS_PATH, FILES_WATCH_INTERVAL
+
+# Preferred extensions, in order of precedence when several files share an id
+FILE_EXTENSIONS = (".pdf", ".PDF", ".htm", ".html", ".HTML", ".docx", ".doc", ".txt")
+
+
+class FileIndex:
+    """
+    Map of document ids to file names in a directory.
+
+    The map is replaced as a whole on every refresh, so readers never see a
+    partially built map.
+    """
+
+    def __init__(self, directory: Path):
+        self.directory = directory
+        self._files: dict[str, str] = {}
+        self._mtime_ns: int | None = None
+        self._lock = threading.Lock()
+
+    def refresh(self) -> None:
+        """Rescan the directory."""
+        with self._lock:
+            try:
+                mtime_ns = self.directory.stat().st_mtime_ns
+                entries = [e.name for e in os.scandir(self.directory) if e.is_file()]
+            except FileNotFoundError:
+                mtime_ns, entries = None, []
+
+            rank = {ext: i for i, ext in enumerate(FILE_EXTENSIONS)}
+            best: dict[str, tuple[int, str]] = {}
+            for name in entries:
+                ext = os.path.splitext(name)[1]
+                if ext not in rank:
+                    continue
+                doc_id = name[: -len(ext)]
+                if doc_id not in best or rank[ext] < best[doc_id][0]:
+                    best[doc_id] = (rank[ext], name)
+            self._files = {doc_id: name for doc_id, (_, name) in best.items()}
+            self._mtime_ns = mtime_ns
+
+    def refresh_if_changed(self) -> None:
+        """Rescan only if the directory's modification time changed."""
+        try:
+            mtime_ns = self.directory.stat().st_mtime_ns
+        except FileNotFoundError:
+            mtime_ns = None
+        if mtime_ns != self._mtime_ns:
+            self.refresh()
+
+    def url(self, doc_id) -> str | None:
+        """Return ``/files/<name>`` for ``doc_id``, or None if there is no file."""
+        name = self._files.get(str(doc_id))
+        return f"/files/{name}" if name is not None else None
+
+    def watch(self, interval: float) -> threading.Thread:
+        """Start a daemon thread that polls the directory every ``interval`` seconds."""
+        def run():
+            while True:
+                time.sleep(interval)
+                self.refresh_if_changed()
+
+        thread = threading.Thread(target=run, name="files-watcher", daemon=True)
+        thread.start()
+        return thread
+
+
+_FILES = FileIndex(Path(CORPUS_PATH) / "files")
+
+
+def file_url(doc_id) -> str | None:
+    """Download URL of the original file of ``doc_id``, if one exists."""
+    return _FILES.url(doc_id)
+
+
+def refresh_files() -> None:
+    """Rescan the `files` directory (e.g. after an upload)."""
+    _FILES.refresh()
+
+
+# Initial scan at module import
+_FILES.refresh()
+if FILES_WATCH_INTERVAL > 0:
+    _FILES.watch(FILES_WATCH_INTERVAL)
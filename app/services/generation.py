@@ -0,0 +1,70 @@
+# Copyright 2025 Leon Hecht
+# Licensed under the Apache License, Version 2.0 (see LICENSE file)
+
+"""
+Immutable index generations.
+
+A generation bundles everything a search reads -- the documents, the index
+built over them and its metadata -- so the three can never disagree. Writers
+build a complete new generation and publish it by rebinding a single module
+global, which is atomic in Python. Readers grab that reference once per query
+and keep using it even if a newer generation is published meanwhile; the old
+generation (and any memory-mapped snapshot behind it) is freed by reference
+counting once the last in-flight query drops it.
+"""
+
+import itertools
+import time
+from collections.abc import Sequence
+from dataclasses import dataclass, field
+
+from app.services.inverted_index import InvertedIndex
+from app.services.snippets import SnippetIndex
+
+_counter = itertools.count(1)
+
+
+def next_generation_number() -> int:
+    """Monotonically increasing generation number (per process)."""
+    return next(_counter)
+
+
+def id_positions(corpus: Sequence[dict]) -> dict[str, list[int]]:
+    """Map every document id of ``corpus`` to its positions."""
+    ids = corpus.ids() if hasattr(corpus, "ids") else (doc["id"] for doc in corpus)
+    positions: dict[str, list[int]] = {}
+    for i, doc_id in enumerate(ids):
+        positions.setdefault(doc_id, []).append(i)
+    return positions
+
+
+@dataclass(frozen=True)
+class IndexGeneration:
+    """
+    One published state of the BM25 corpus and index.
+
+    Attributes
+    ----------
+    number : int
+        Generation number; newer generations have higher numbers.
+    corpus : Sequence[dict]
+        Documents, aligned with the index positions.
+    index : InvertedIndex | None
+        BM25 index, or None when the corpus is empty.
+    snippets : SnippetIndex | None
+        Word offsets for snippet extraction, aligned with ``index``.
+    fingerprint : str | None
+        Fingerprint of the corpus files the generation was loaded from.
+    positions : dict[str, list[int]]
+        Live (not tombstoned) positions of every document id, so uploads
+        find the documents they replace without reading the corpus.
+    created : float
+        Unix timestamp of when the generation was built.
+    """
+    number: int
+    corpus: Sequence[dict]
+    index: InvertedIndex | None
+    snippets: SnippetIndex | None = None
+    fingerprint: str | None = None
+    positions: dict[str, list[int]] = field(default_factory=dict)
+    created: float = field(default_factory=time.time)
@@ -0,0 +1,72 @@
+# Copyright 2025 Leon Hecht
+# Licensed under the Apache License, Version 2.0 (see LICENSE file)
+
+"""Turn ranked document positions into the hits returned by `/search`."""
+
+import time
+
+from app.services.files import file_url
+from app.services.generation import IndexGeneration
+from app.services.logs import log_event
+from app.services.metrics import STAGE_SECONDS, WARNINGS
+
+
+def snippet_terms(tokens: list[str]) -> list[str]:
+    """Query terms used to place snippets; short words are skipped if possible."""
+    cleaned = [tok for tok in tokens if len(tok) > 3]
+    return cleaned if cleaned else tokens
+
+
+def build_hits(gen: IndexGeneration, idxs, scores, terms: list[str]) -> list[dict]:
+    """
+    Build the result dicts of the documents ``idxs`` of ``gen``.
+
+    Parameters
+    ----------
+    gen : IndexGeneration
+        Generation the positions refer to.
+    idxs : sequence of int
+        Document positions, best first.
+    scores : sequence of float
+        Score of each position in ``idxs``.
+    terms : list[str]
+        Normalized query terms to center the snippets on.
+
+    Returns
+    -------
+    list[dict]
+        One dict per document with id, title, score, snippet and download_url.
+    """
+    results = []
+    snippet_time = file_time = 0.0
+    for i, score in zip(idxs, scores):
+        doc = gen.corpus[i]
+        text = doc["text"]
+
+        # 50-word window around the first match of any query term
+        start = time.perf_counter()
+        snippet = gen.snippets.snippet(i, text, terms)
+        # look up the original file (pdf, html, docx, etc.)
+        looked_up = time.perf_counter()
+        download_url = file_url(doc["id"])
+        snippet_time += looked_up - start
+        file_time += time.perf_counter() - looked_up
+
+        if snippet == "":
+            WARNINGS.inc("no_snippet")
+            log_event("no_snippet", doc_id=doc["id"])
+        if download_url is None:
+            WARNINGS.inc("no_file")
+            log_event("no_file", doc_id=doc["id"])
+
+        results.append({
+            "id": doc["id"],
+            "title": doc.get("title") or "",
+            "score": float(score),
+            "snippet": snippet,
+            "download_url": download_url,
+        })
+    # one observation per request, not per hit
+    STAGE_SECONDS.observe(snippet_time, "snippet")
+    STAGE_SECONDS.observe(file_time, "file_lookup")
+    return results
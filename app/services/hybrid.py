@@ -0,0 +1,154 @@
+# Copyright 2025 Leon Hecht
+# Licensed under the Apache License, Version 2.0 (see LICENSE file)
+
+"""
+Hybrid search: BM25 and dense retrieval over the same generation.
+
+Both retrievers work on the generation the embeddings were computed for,
+so document positions line up. The query is embedded on a helper thread
+while BM25 scores the corpus on the calling thread, then either
+
+- ``rrf``: the top ``HYBRID_CANDIDATES`` of both rankings are fused with
+  reciprocal rank fusion, ``w / (HYBRID_RRF_K + rank)`` per ranking, or
+- ``rerank``: the top ``HYBRID_CANDIDATES`` BM25 documents are scored by
+  dot product with the query embedding. Queries without any BM25 match
+  fall back to the dense ranking.
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from app.config import (
+    HYBRID_FUSION, HYBRID_CANDIDATES, HYBRID_RRF_K, HYBRID_BM25_WEIGHT, HYBRID_DENSE_WEIGHT, SEARCH_WORKERS,
+)
+from app.services.cache import RESULT_CACHE
+from app.services.hits import build_hits, snippet_terms
+from app.services.metrics import stage
+from app.services.normalize import normalize, normalize_token
+from app.services.ranking import top_k_indices
+from app.services.transformer import corpus_state, encode_query
+
+# one dense half per search thread, so a hybrid search never waits for a slot
+_DENSE_POOL = ThreadPoolExecutor(max_workers=SEARCH_WORKERS, thread_name_prefix="hybrid-dense")
+
+
+def reciprocal_rank_fusion(rankings, weights, k: int, top_k: int) -> tuple[list[int], list[float]]:
+    """
+    Fuse rankings of document positions by weighted reciprocal rank.
+
+    Parameters
+    ----------
+    rankings : sequence of sequence of int
+        Document positions of each ranking, best first.
+    weights : sequence of float
+        Weight of each ranking.
+    k : int
+        Rank offset; larger values flatten the contribution of top ranks.
+    top_k : int
+        Number of documents to return.
+
+    Returns
+    -------
+    tuple[list[int], list[float]]
+        Positions ordered by descending fused score (ties by position) and
+        their fused scores.
+    """
+    fused: dict[int, float] = {}
+    for ranking, weight in zip(rankings, weights):
+        for rank, i in enumerate(ranking, start=1):
+            i = int(i)
+            fused[i] = fused.get(i, 0.0) + weight / (k + rank)
+    order = sorted(fused, key=lambda i: (-fused[i], i))[:top_k]
+    return order, [fused[i] for i in order]
+
+
+def _dense_half(vectors, q_norm: str, k: int):
+    """Embed the query and, if ``k`` is positive, rank the top ``k`` documents."""
+    with stage("encode"):
+        q_emb = encode_query(q_norm)
+    if not k:
+        return q_emb
+    with stage("score"):
+        return vectors.search(q_emb, k)
+
+
+def hybrid_rank(gen, vectors, q_norm: str, tokenized_query: list[str], top_k: int,
+                fusion: str = HYBRID_FUSION) -> tuple:
+    """
+    Rank the documents of ``gen`` by BM25 and dense similarity together.
+
+    Parameters
+    ----------
+    gen : IndexGeneration
+        Generation the embeddings were computed for.
+    vectors : FlatIndex or IVFIndex
+        Vector index over the embeddings of ``gen``.
+    q_norm : str
+        Normalized query.
+    tokenized_query : list[str]
+        Normalized query tokens, without empty ones.
+    top_k : int
+        Number of documents to return.
+    fusion : str
+        ``"rrf"`` or ``"rerank"``.
+
+    Returns
+    -------
+    tuple
+        Document positions, best first, and their scores.
+    """
+    n_candidates = max(HYBRID_CANDIDATES, top_k)
+    # embed (and, for rrf, rank) on a helper thread while BM25 scores here
+    dense = _DENSE_POOL.submit(_dense_half, vectors, q_norm, n_candidates if fusion == "rrf" else 0)
+    bm25_idxs = np.zeros(0, dtype=np.int64)
+    if tokenized_query:
+        with stage("score"):
+            scores = gen.index.get_scores(tokenized_query)
+        with stage("topk"):
+            bm25_idxs = top_k_indices(scores, n_candidates)
+
+    if fusion == "rrf":
+        dense_idxs, _ = dense.result()
+        with stage("fuse"):
+            idxs, scores = reciprocal_rank_fusion(
+                [bm25_idxs, dense_idxs], [HYBRID_BM25_WEIGHT, HYBRID_DENSE_WEIGHT], HYBRID_RRF_K, top_k,
+            )
+    elif len(bm25_idxs):
+        q_emb = dense.result()
+        with stage("fuse"):
+            # ascending positions: sequential reads and ties broken by position
+            candidates = np.sort(bm25_idxs)
+            sims = vectors.embs[candidates] @ q_emb
+            best = top_k_indices(sims, top_k)
+            idxs, scores = candidates[best], sims[best]
+    else:
+        q_emb = dense.result()
+        with stage("score"):
+            idxs, scores = vectors.search(q_emb, top_k)
+    return idxs, scores
+
+
+def hybrid_search(query: str, top_k: int = 30) -> list[dict]:
+    """
+    Return top_k documents ranked by BM25 and dense similarity together.
+
+    Hits have the same fields as `bm25_search`; the score is the fused RRF
+    score or, with ``HYBRID_FUSION=rerank``, the dense similarity.
+    """
+    gen, vectors, _ = corpus_state()
+    if not len(gen.corpus) or gen.index is None:
+        return []
+
+    with stage("tokenize"):
+        q_norm = normalize(query)
+        tokenized_query = [tok for tok in (normalize_token(t) for t in q_norm.split()) if tok]
+    cache_key = ("hibrida", q_norm, top_k, gen.number)
+    cached = RESULT_CACHE.get(cache_key)
+    if cached is not None:
+        return [dict(hit) for hit in cached]
+
+    idxs, scores = hybrid_rank(gen, vectors, q_norm, tokenized_query, top_k)
+    results = build_hits(gen, idxs, scores, snippet_terms(tokenized_query))
+    RESULT_CACHE.put(cache_key, results)
+    return [dict(hit) for hit in results]
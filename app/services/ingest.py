@@ -0,0 +1,179 @@
+# Copyright 2025 Leon Hecht
+# Licensed under the Apache License, Version 2.0 (see LICENSE file)
+
+"""
+Parallel corpus ingestion.
+
+``corpus.jsonl`` is split into byte ranges that end on line boundaries and
+the ``.txt`` fallback into batches of consecutive files. Worker processes
+parse, normalize and index their slice into a partial index with a local
+vocabulary, plus the word offsets used for snippets. The parent merges the
+slices in corpus order, so the result is identical to a sequential load
+no matter how many workers ran.
+
+Documents are streamed from disk: a slice is read through a small buffer
+and its token lists are turned into compact segments every
+``SEGMENT_DOCS`` documents, so neither the file nor the Python token lists
+of a whole slice are ever held in memory at once.
+
+This module must not import app.config or the search services: it is
+imported by every (spawned) worker process.
+"""
+
+import io
+import json
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import numpy as np
+
+from app.services.inverted_index import InvertedIndex, segment
+from app.services.normalize import normalize_tokens
+from app.services.snippets import word_offsets
+
+# Below this much input a process pool costs more than it saves
+MIN_PARALLEL_BYTES = 8 << 20
+# Slices per worker, so uneven slices still keep every core busy
+CHUNKS_PER_WORKER = 4
+# Documents tokenized before they are packed into a segment
+SEGMENT_DOCS = 10_000
+
+
+def _jsonl_ranges(path: Path, n_chunks: int) -> list[tuple[int, int]]:
+    """Split ``path`` into at most ``n_chunks`` byte ranges of whole lines."""
+    size = path.stat().st_size
+    bounds = [0]
+    with path.open("rb") as f:
+        for i in range(1, n_chunks):
+            f.seek(max(size * i // n_chunks, bounds[-1]))
+            f.readline()
+            pos = f.tell()
+            if pos >= size:
+                break
+            if pos > bounds[-1]:
+                bounds.append(pos)
+    bounds.append(size)
+    return list(zip(bounds[:-1], bounds[1:]))
+
+
+class _RangeReader(io.RawIOBase):
+    """Raw stream over the bytes ``[start, end)`` of a file."""
+
+    def __init__(self, f, start: int, end: int):
+        f.seek(start)
+        self._f = f
+        self._left = end - start
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buf) -> int:
+        n = self._f.readinto(memoryview(buf)[:min(len(buf), self._left)])
+        self._left -= n
+        return n
+
+
+class _Segments:
+    """Accumulates token lists and packs them into segments in batches."""
+
+    def __init__(self):
+        self.segments = []
+        self._tokenized = []
+
+    def add(self, tokens: list[str]):
+        self._tokenized.append(tokens)
+        if len(self._tokenized) >= SEGMENT_DOCS:
+            self.flush()
+
+    def flush(self) -> list:
+        if self._tokenized or not self.segments:
+            self.segments.append(segment(self._tokenized))
+            self._tokenized = []
+        return self.segments
+
+
+def _ingest_jsonl_range(path: Path, start: int, end: int):
+    docs, segments, offsets = [], _Segments(), []
+    with path.open("rb") as f:
+        # same line splitting as iterating over a text-mode file
+        for line in io.TextIOWrapper(io.BufferedReader(_RangeReader(f, start, end)), encoding="utf-8"):
+            try:
+                obj = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+
+            title = obj.get("title", "")
+            text = obj.get("text", "")
+            content = f"{title} {text}".strip()
+
+            docs.append({"id": obj.get("id"), "title": title, "text": content})
+            segments.add(normalize_tokens(content))
+            offsets.append(word_offsets(content))
+    return docs, segments.flush(), _flat(offsets)
+
+
+def _ingest_txt_batch(files: list[Path]):
+    docs, segments, offsets = [], _Segments(), []
+    for file in files:
+        text = file.read_text(encoding="utf-8")
+        docs.append({"id": file.stem, "text": text})
+        segments.add(text.split())
+        offsets.append(word_offsets(text))
+    return docs, segments.flush(), _flat(offsets)
+
+
+def _flat(offsets: list[np.ndarray]) -> np.ndarray:
+    return np.concatenate(offsets) if offsets else np.zeros(0, dtype=np.int32)
+
+
+def _run(func, tasks: list[tuple], parallel: bool, workers: int) -> list:
+    if not parallel or len(tasks) < 2:
+        return [func(*task) for task in tasks]
+    # spawn: forking a server process that runs other threads is unsafe
+    ctx = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=min(workers, len(tasks)), mp_context=ctx) as pool:
+        return list(pool.map(func, *zip(*tasks)))
+
+
+def ingest_corpus(corpus_path: str, workers: int):
+    """
+    Read, tokenize and index every document under ``corpus_path``.
+
+    Parameters
+    ----------
+    corpus_path : str
+        Directory holding ``corpus.jsonl`` or ``.txt`` files.
+    workers : int
+        Maximum number of worker processes.
+
+    Returns
+    -------
+    tuple[list[dict], InvertedIndex, np.ndarray, bool]
+        Documents, their index, the word offsets of every token, and whether
+        the index holds raw (unnormalized) tokens, as for ``.txt`` corpora.
+    """
+    root = Path(corpus_path)
+    jsonl_file = root / "corpus.jsonl"
+    if jsonl_file.exists():
+        raw = False
+        size = jsonl_file.stat().st_size
+        parallel = workers > 1 and size >= MIN_PARALLEL_BYTES
+        n_chunks = workers * CHUNKS_PER_WORKER if parallel else 1
+        tasks = [(jsonl_file, start, end) for start, end in _jsonl_ranges(jsonl_file, n_chunks)]
+        results = _run(_ingest_jsonl_range, tasks, parallel, workers)
+    else:
+        raw = True
+        files = list(root.glob("**/*.txt"))
+        size = sum(os.path.getsize(f) for f in files)
+        parallel = workers > 1 and size >= MIN_PARALLEL_BYTES
+        n_chunks = min(len(files), workers * CHUNKS_PER_WORKER) if parallel else 1
+        step = -(-len(files) // n_chunks) if files else 1
+        tasks = [(files[i:i + step],) for i in range(0, len(files), step)]
+        results = _run(_ingest_txt_batch, tasks, parallel, workers)
+
+    corpus = [doc for docs, _, _ in results for doc in docs]
+    index = InvertedIndex.from_segments(seg for _, segs, _ in results for seg in segs)
+    offsets = _flat([offs for _, _, offs in results])
+    return corpus, index, offsets, raw
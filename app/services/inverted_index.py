@@ -0,0 +1,307 @@
+# Copyright 2025 Leon Hecht
+# Licensed under the Apache License, Version 2.0 (see LICENSE file)
+
+"""
+Sparse inverted index with Okapi BM25 scoring.
+
+Postings are stored in CSR layout: the postings of term ``t`` live in
+``doc_ids[indptr[t]:indptr[t + 1]]`` (sorted ascending) with the matching
+term frequencies in ``tfs``. A query only touches the postings of its own
+terms, while scores stay identical to ``rank_bm25.BM25Okapi``.
+
+Indexes are never modified in place: ``add_documents`` returns a new index
+that shares nothing mutable with the old one, so searches running against
+the previous index are unaffected.
+"""
+
+import math
+import numpy as np
+
+
+def _segment(tokenized: list[list[str]], vocab: dict[str, int]):
+    """
+    Turn token lists into postings sorted by term, then by document.
+
+    New terms are added to ``vocab`` in order of first occurrence. Document
+    positions in the returned postings are relative to the segment.
+
+    Returns
+    -------
+    tuple
+        ``(lengths, term_ids, terms, doc_ids, tfs, first_pos)`` where
+        ``term_ids`` is the token stream and the other arrays are the postings.
+    """
+    n_docs = len(tokenized)
+    lengths = np.fromiter((len(toks) for toks in tokenized), dtype=np.int64, count=n_docs)
+    term_ids = np.fromiter(
+        (vocab.setdefault(tok, len(vocab)) for toks in tokenized for tok in toks),
+        dtype=np.int64,
+        count=int(lengths.sum()),
+    )
+    doc_of = np.repeat(np.arange(n_docs, dtype=np.int64), lengths)
+
+    # one key per (term, doc) pair; unique() sorts by term, then by doc and
+    # reports the first occurrence of each pair in the token stream
+    stride = max(n_docs, 1)
+    keys, first, tfs = np.unique(term_ids * stride + doc_of, return_index=True, return_counts=True)
+    doc_ids = keys % stride
+    doc_start = np.cumsum(lengths) - lengths
+    return lengths, term_ids, keys // stride, doc_ids, tfs, first - doc_start[doc_ids]
+
+
+def segment(tokenized: list[list[str]]) -> tuple:
+    """
+    Partial index of a slice of the corpus with its own local vocabulary.
+
+    Returns ``(local_terms, lengths, term_ids, terms, doc_ids, tfs, first_pos)``
+    where ``local_terms`` lists the terms in local id order. Segments are
+    cheap to pickle and are combined with `InvertedIndex.from_segments`.
+    """
+    vocab: dict[str, int] = {}
+    parts = _segment(tokenized, vocab)
+    return (list(vocab), *parts)
+
+
+class InvertedIndex:
+    """
+    BM25 inverted index over a tokenized corpus.
+
+    Attributes
+    ----------
+    vocab : dict[str, int]
+        Term -> term id, in order of first occurrence in the corpus.
+    indptr : np.ndarray
+        int64 array of length ``len(vocab) + 1`` with postings offsets.
+    doc_ids : np.ndarray
+        int32 document positions of every posting.
+    tfs : np.ndarray
+        int32 term frequencies of every posting.
+    first_pos : np.ndarray
+        int32 token position of the first occurrence of the term in the
+        document, for every posting.
+    doc_len : np.ndarray
+        int32 number of tokens per document.
+    doc_terms : np.ndarray
+        int32 term ids of the whole tokenized corpus in document order; the
+        tokens of document ``d`` start at ``doc_len[:d].sum()``.
+    deleted : np.ndarray
+        int32 positions of tombstoned documents. They keep their postings
+        but are excluded from the statistics and never score.
+    idf : np.ndarray
+        float64 IDF per term id.
+    norms : np.ndarray
+        float64 per-document length normalization ``k1 * (1 - b + b * dl / avgdl)``.
+    """
+
+    def __init__(self, vocab, indptr, doc_ids, tfs, first_pos, doc_len, doc_terms,
+                 k1: float = 1.5, b: float = 0.75, epsilon: float = 0.25,
+                 idf: np.ndarray | None = None, norms: np.ndarray | None = None,
+                 deleted: np.ndarray | None = None):
+        self.vocab = vocab
+        self.indptr = indptr
+        self.doc_ids = doc_ids
+        self.tfs = tfs
+        self.first_pos = first_pos
+        self.doc_len = doc_len
+        self.doc_terms = doc_terms
+        self.k1 = k1
+        self.b = b
+        self.epsilon = epsilon
+        self.deleted = np.zeros(0, dtype=np.int32) if deleted is None else deleted
+        self.corpus_size = len(doc_len)
+        self.n_live = self.corpus_size - len(self.deleted)
+        live_len = int(doc_len.sum()) - int(doc_len[self.deleted].sum())
+        self.avgdl = live_len / self.n_live if self.n_live else 0.0
+        # statistics may come precomputed from a snapshot
+        self.idf = self._compute_idf() if idf is None else idf
+        self.norms = self._compute_norms() if norms is None else norms
+
+    @classmethod
+    def build(cls, tokenized: list[list[str]], **params) -> "InvertedIndex":
+        """
+        Build an index from one token list per document.
+
+        Parameters
+        ----------
+        tokenized : list[list[str]]
+            Tokens of every document, in corpus order.
+        **params
+            BM25 parameters ``k1``, ``b`` and ``epsilon``.
+        """
+        return cls.from_segments([segment(tokenized)], **params)
+
+    @classmethod
+    def from_segments(cls, segments, **params) -> "InvertedIndex":
+        """
+        Merge partial indexes of consecutive corpus slices into one index.
+
+        Local vocabularies are merged in segment order, which reproduces the
+        first-occurrence term order of a sequential build, and the postings
+        are stably re-sorted by global term id. The result is identical to
+        `build` over the concatenated documents.
+
+        Parameters
+        ----------
+        segments : Iterable[tuple]
+            Outputs of `segment`, in corpus order.
+        **params
+            BM25 parameters ``k1``, ``b`` and ``epsilon``.
+        """
+        vocab: dict[str, int] = {}
+        parts = []
+        n_docs = 0
+        for local_vocab, lengths, term_ids, terms, doc_ids, tfs, first_pos in segments:
+            remap = np.fromiter(
+                (vocab.setdefault(t, len(vocab)) for t in local_vocab), dtype=np.int64, count=len(local_vocab),
+            )
+            parts.append((lengths, remap[term_ids], remap[terms], doc_ids + n_docs, tfs, first_pos))
+            n_docs += len(lengths)
+
+        lengths, term_ids, terms, doc_ids, tfs, first_pos = (
+            np.concatenate([p[i] for p in parts]) if parts else np.zeros(0, dtype=np.int64)
+            for i in range(6)
+        )
+        # segments are in document order, so a stable sort by term keeps
+        # every term's postings sorted by document
+        order = np.argsort(terms, kind="stable") if len(parts) > 1 else slice(None)
+        indptr = np.zeros(len(vocab) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(terms, minlength=len(vocab)), out=indptr[1:])
+        return cls(
+            vocab, indptr, doc_ids[order].astype(np.int32), tfs[order].astype(np.int32),
+            first_pos[order].astype(np.int32), lengths.astype(np.int32),
+            term_ids.astype(np.int32), **params,
+        )
+
+    def add_documents(self, tokenized: list[list[str]], deleted=()) -> "InvertedIndex":
+        """
+        Return a new index with documents appended and others tombstoned.
+
+        The new documents get positions ``corpus_size, corpus_size + 1, ...``.
+        Their postings are merged behind the existing postings of each term,
+        so no existing document is re-tokenized. Document frequencies, IDF
+        and the average length are recomputed over the live documents.
+
+        Parameters
+        ----------
+        tokenized : list[list[str]]
+            Tokens of every new document.
+        deleted : Iterable[int]
+            Positions of existing documents to tombstone.
+        """
+        vocab = dict(self.vocab)
+        lengths, term_ids, new_terms, new_docs, new_tfs, new_first = _segment(tokenized, vocab)
+        n_terms = len(vocab)
+        n_old_terms = len(self.vocab)
+
+        old_counts = np.zeros(n_terms, dtype=np.int64)
+        old_counts[:n_old_terms] = np.diff(self.indptr)
+        new_counts = np.bincount(new_terms, minlength=n_terms)
+        indptr = np.zeros(n_terms + 1, dtype=np.int64)
+        np.cumsum(old_counts + new_counts, out=indptr[1:])
+
+        # scatter old postings to the front and new ones to the back of each term
+        n_old = len(self.doc_ids)
+        old_terms = np.repeat(np.arange(n_old_terms), old_counts[:n_old_terms])
+        old_dest = indptr[old_terms] + np.arange(n_old) - self.indptr[old_terms]
+        new_start = np.cumsum(new_counts) - new_counts
+        new_dest = indptr[new_terms] + old_counts[new_terms] + np.arange(len(new_terms)) - new_start[new_terms]
+
+        doc_ids = np.empty(n_old + len(new_terms), dtype=np.int32)
+        tfs = np.empty(n_old + len(new_terms), dtype=np.int32)
+        first_pos = np.empty(n_old + len(new_terms), dtype=np.int32)
+        doc_ids[old_dest] = self.doc_ids
+        doc_ids[new_dest] = new_docs + self.corpus_size
+        tfs[old_dest] = self.tfs
+        tfs[new_dest] = new_tfs
+        first_pos[old_dest] = self.first_pos
+        first_pos[new_dest] = new_first
+
+        tombstones = np.union1d(self.deleted, np.fromiter(deleted, dtype=np.int32))
+        return InvertedIndex(
+            vocab, indptr, doc_ids, tfs, first_pos,
+            np.concatenate([self.doc_len, lengths.astype(np.int32)]),
+            np.concatenate([self.doc_terms, term_ids.astype(np.int32)]),
+            k1=self.k1, b=self.b, epsilon=self.epsilon,
+            deleted=tombstones.astype(np.int32),
+        )
+
+    def doc_freqs(self) -> np.ndarray:
+        """Number of live documents containing each term."""
+        df = np.diff(self.indptr)
+        if not len(self.deleted):
+            return df
+        terms = np.repeat(np.arange(len(df)), df)
+        dead = np.zeros(self.corpus_size, dtype=bool)
+        dead[self.deleted] = True
+        return df - np.bincount(terms[dead[self.doc_ids]], minlength=len(df))
+
+    def _compute_idf(self) -> np.ndarray:
+        # Mirror BM25Okapi exactly: math.log, sequential sum in vocab order,
+        # and negative IDFs floored to epsilon * average IDF. Terms that only
+        # occur in tombstoned documents are left out of the average.
+        df = self.doc_freqs()
+        idf = np.empty(len(df), dtype=np.float64)
+        idf_sum = 0.0
+        n_terms = 0
+        n = self.n_live
+        for t, freq in enumerate(df.tolist()):
+            val = math.log(n - freq + 0.5) - math.log(freq + 0.5)
+            idf[t] = val
+            if freq:
+                idf_sum += val
+                n_terms += 1
+        if n_terms:
+            eps = self.epsilon * (idf_sum / n_terms)
+            idf[idf < 0] = eps
+        return idf
+
+    def _compute_norms(self) -> np.ndarray:
+        if not self.n_live:
+            return np.zeros(self.corpus_size, dtype=np.float64)
+        return self.k1 * (1 - self.b + self.b * self.doc_len.astype(np.float64) / self.avgdl)
+
+    def first_position(self, term_id: int, doc: int) -> int | None:
+        """Token position of the first ``term_id`` in ``doc``, if it occurs."""
+        start, end = self.indptr[term_id], self.indptr[term_id + 1]
+        docs = self.doc_ids[start:end]
+        j = int(np.searchsorted(docs, doc))
+        if j < len(docs) and docs[j] == doc:
+            return int(self.first_pos[start + j])
+        return None
+
+    def postings(self, term: str) -> tuple[np.ndarray, np.ndarray]:
+        """Return ``(doc_ids, tfs)`` for ``term`` (empty arrays if unknown)."""
+        t = self.vocab.get(term)
+        if t is None:
+            return self.doc_ids[:0], self.tfs[:0]
+        start, end = self.indptr[t], self.indptr[t + 1]
+        return self.doc_ids[start:end], self.tfs[start:end]
+
+    def get_scores(self, query: list[str]) -> np.ndarray:
+        """
+        Compute BM25 scores of every document for a tokenized query.
+
+        Only the postings of the query terms are visited; documents that
+        contain none of the terms, and tombstoned documents, score 0.
+
+        Parameters
+        ----------
+        query : list[str]
+            Normalized query tokens (duplicates count once per occurrence).
+
+        Returns
+        -------
+        np.ndarray
+            float64 array with one score per document.
+        """
+        scores = np.zeros(self.corpus_size, dtype=np.float64)
+        for q in query:
+            t = self.vocab.get(q)
+            if t is None:
+                continue
+            start, end = self.indptr[t], self.indptr[t + 1]
+            docs = self.doc_ids[start:end]
+            tf = self.tfs[start:end].astype(np.float64)
+            scores[docs] += self.idf[t] * (tf * (self.k1 + 1) / (tf + self.norms[docs]))
+        scores[self.deleted] = 0.0
+        return scores
@@ -0,0 +1,133 @@
+# Copyright 2025 Leon Hecht
+# Licensed under the Apache License, Version 2.0 (see LICENSE file)
+
+"""
+Background jobs with pollable status.
+
+Long-running work such as indexing an upload is handed to a `JobQueue`
+and runs on its single worker thread, one job at a time, while the
+request returns the job ID right away. Clients poll the job status until
+it is ``done`` or ``failed``. With a ``status_dir``, every status change
+is also written to ``<status_dir>/<job id>.json``, so any worker process
+can answer a status request, not only the one running the job. Only the
+most recent jobs are kept.
+"""
+
+import json
+import os
+import threading
+import time
+import traceback
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+
+
+@dataclass
+class Job:
+    """
+    Status of one background job.
+
+    Attributes
+    ----------
+    id : str
+        Job ID.
+    description : str
+        What the job does.
+    status : str
+        ``queued``, ``running``, ``done`` or ``failed``.
+    detail : str | None
+        Result summary or error message.
+    created, started, finished : float | None
+        Unix timestamps of the job's life cycle.
+    """
+    id: str
+    description: str
+    status: str = "queued"
+    detail: str | None = None
+    created: float = field(default_factory=time.time)
+    started: float | None = None
+    finished: float | None = None
+
+
+class JobQueue:
+    """
+    Run jobs one after another on a background thread.
+
+    Parameters
+    ----------
+    name : str
+        Name of the worker thread.
+    keep : int
+        Number of finished jobs whose status is remembered.
+    status_dir : Path | None
+        Directory shared by all workers where job status is persisted.
+    """
+
+    def __init__(self, name: str, keep: int = 100, status_dir: Path | None = None):
+        self.keep = keep
+        self.status_dir = status_dir
+        self._pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix=name)
+        self._jobs: OrderedDict[str, Job] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def submit(self, description: str, fn, *args) -> Job:
+        """Queue ``fn(*args)``; its return value becomes the job's detail."""
+        job = Job(id=uuid.uuid4().hex[:12], description=description)
+        with self._lock:
+            self._jobs[job.id] = job
+            while len(self._jobs) > self.keep:
+                self._jobs.popitem(last=False)
+        self._save(job)
+        self._prune()
+        self._pool.submit(self._run, job, fn, args)
+        return job
+
+    def _run(self, job: Job, fn, args):
+        job.started = time.time()
+        job.status = "running"
+        self._save(job)
+        try:
+            result = fn(*args)
+            job.detail = None if result is None else str(result)
+            job.status = "done"
+        except Exception as exc:
+            traceback.print_exc()
+            job.detail = f"{type(exc).__name__}: {exc}"
+            job.status = "failed"
+        job.finished = time.time()
+        self._save(job)
+
+    def _save(self, job: Job):
+        """Write the status of ``job`` for the other workers, atomically."""
+        if self.status_dir is None:
+            return
+        self.status_dir.mkdir(parents=True, exist_ok=True)
+        path = self.status_dir / f"{job.id}.json"
+        tmp = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+        tmp.write_text(json.dumps(asdict(job)), encoding="utf-8")
+        os.replace(tmp, path)
+
+    def _prune(self):
+        """Delete all but the ``keep`` most recent status files."""
+        if self.status_dir is None:
+            return
+        files = sorted(self.status_dir.glob("*.json"), key=lambda f: f.stat().st_mtime, reverse=True)
+        for old in files[self.keep:]:
+            old.unlink(missing_ok=True)
+
+    def get(self, job_id: str) -> dict | None:
+        """Status of job ``job_id`` as a dict, None if unknown."""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is not None:
+                return asdict(job)
+        # accepted by another worker; job IDs are hex, never paths
+        if self.status_dir is None or not job_id.isalnum():
+            return None
+        try:
+            return json.loads((self.status_dir / f"{job_id}.json").read_text(encoding="utf-8"))
+        except (OSError, json.JSONDecodeError):
+            return None
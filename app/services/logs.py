@@ -0,0 +1,84 @@
+# Copyright 2025 Leon Hecht
+# Licensed under the Apache License, Version 2.0 (see LICENSE file)
+
+"""
+Rate-limited structured logging for the search path.
+
+Events are logged as one JSON object per line through the ``app`` logger,
+so a burst of identical warnings (e.g. many hits without a downloadable
+file) costs a counter update instead of a write each.
+"""
+
+import json
+import logging
+import threading
+import time
+
+from app.config import LOG_RATE_LIMIT, LOG_RATE_INTERVAL
+
+logger = logging.getLogger("app")
+
+
+class RateLimiter:
+    """
+    Allow at most ``limit`` events per key in every window of ``interval`` seconds.
+
+    Parameters
+    ----------
+    limit : int
+        Events allowed per window; 0 or less allows everything.
+    interval : float
+        Window length in seconds.
+    """
+
+    def __init__(self, limit: int, interval: float):
+        self.limit = limit
+        self.interval = interval
+        # key -> [window start, events in window, suppressed events]
+        self._windows: dict[str, list] = {}
+        self._lock = threading.Lock()
+
+    def allow(self, key: str) -> int | None:
+        """Return the number of events suppressed before this one, None to drop it."""
+        if self.limit <= 0:
+            return 0
+        now = time.monotonic()
+        with self._lock:
+            window = self._windows.get(key)
+            if window is None or now - window[0] >= self.interval:
+                suppressed = window[2] if window is not None else 0
+                self._windows[key] = [now, 1, 0]
+                return suppressed
+            if window[1] < self.limit:
+                window[1] += 1
+                suppressed, window[2] = window[2], 0
+                return suppressed
+            window[2] += 1
+            return None
+
+
+_LIMITER = RateLimiter(LOG_RATE_LIMIT, LOG_RATE_INTERVAL)
+
+
+def log_event(event: str, level: int = logging.WARNING, **fields):
+    """
+    Log ``event`` with its fields as JSON, rate-limited per event name.
+
+    Parameters
+    ----------
+    event : str
+        Event name, also the rate-limiting key.
+    level : int
+        Logging level.
+    **fields
+        JSON-serializable details, e.g. ``doc_id``.
+    """
+    if not logger.isEnabledFor(level):
+        return
+    suppressed = _LIMITER.allow(event)
+    if suppressed is None:
+        return
+    record = {"event": event, **fields}
+    if suppressed:
+        record["suppressed"] = suppressed
+    logger.log(level, json.dumps(record, ensure_ascii=False, default=str))
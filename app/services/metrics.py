@@ -0,0 +1,158 @@
+# Copyright 2025 Leon Hecht
+# Licensed under the Apache License, Version 2.0 (see LICENSE file)
+
+"""
+Counters and latency histograms in the Prometheus text format.
+
+Metrics are kept in the memory of each worker process and rendered by
+`render` for the ``/metrics`` endpoint. Every search stage is timed into
+``search_stage_seconds`` with a ``stage`` label:
+
+- ``tokenize``: query normalization and tokenization,
+- ``encode``: query embedding (cache lookups, batching and the model),
+- ``score``: BM25, lexical-weight or vector scoring,
+- ``topk``: selection of the best documents,
+- ``fuse``: combination of the rankings of hybrid search,
+- ``snippet`` and ``file_lookup``: building the hits of one request,
+- ``geoip``: client location lookup,
+- ``db_log``: one batched write of query log rows.
+"""
+
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+# upper bounds in seconds, from sub-millisecond scoring to slow encodings
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _labels(names: tuple, values: tuple, extra: str = "") -> str:
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _number(value: float) -> str:
+    return repr(float(value))
+
+
+class Counter:
+    """
+    Monotonic counter, one value per combination of label values.
+
+    Parameters
+    ----------
+    name : str
+        Metric name, by convention ending in ``_total``.
+    help : str
+        One-line description.
+    labels : tuple[str, ...]
+        Label names.
+    """
+
+    def __init__(self, name: str, help: str, labels: tuple = ()):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self._values: dict[tuple, float] = {}
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def inc(self, *label_values, amount: float = 1.0):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0.0) + amount
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            items = sorted(self._values.items())
+        for values, count in items:
+            lines.append(f"{self.name}{_labels(self.labels, values)} {_number(count)}")
+        return lines
+
+
+class Histogram:
+    """
+    Distribution of observed values in cumulative buckets.
+
+    Parameters
+    ----------
+    name : str
+        Metric name, by convention ending in the unit (``_seconds``).
+    help : str
+        One-line description.
+    labels : tuple[str, ...]
+        Label names.
+    buckets : tuple[float, ...]
+        Ascending upper bounds; ``+Inf`` is implied.
+    """
+
+    def __init__(self, name: str, help: str, labels: tuple = (), buckets: tuple = DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = tuple(buckets)
+        # per label values: [count per bucket (last is +Inf), sum]
+        self._series: dict[tuple, list] = {}
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def observe(self, value: float, *label_values):
+        slot = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][slot] += 1
+            series[1] += value
+
+    @contextmanager
+    def time(self, *label_values):
+        """Observe the wall-clock duration of the ``with`` block."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, *label_values)
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            items = sorted((values, (list(counts), total)) for values, (counts, total) in self._series.items())
+        for values, (counts, total) in items:
+            cumulative = 0
+            for bound, n in zip((*self.buckets, "+Inf"), counts):
+                cumulative += n
+                le = f'le="{bound if bound == "+Inf" else _number(bound)}"'
+                lines.append(f"{self.name}_bucket{_labels(self.labels, values, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labels, values)} {_number(total)}")
+            lines.append(f"{self.name}_count{_labels(self.labels, values)} {cumulative}")
+        return lines
+
+
+REGISTRY: list[Counter | Histogram] = []
+
+
+def render() -> str:
+    """All metrics of this process in the Prometheus text exposition format."""
+    return "\n".join(line for metric in REGISTRY for line in metric.render()) + "\n"
+
+
+STAGE_SECONDS = Histogram("search_stage_seconds", "Time spent in each stage of serving a search", ("stage",))
+REQUEST_SECONDS = Histogram("search_request_seconds", "Time to answer a /search request", ("mode",))
+REQUESTS = Counter("search_requests_total", "Answered /search requests", ("mode",))
+WARNINGS = Counter("search_warnings_total", "Hits without a snippet or a downloadable file", ("kind",))
+REJECTED = Counter("rejected_requests_total", "Requests answered with 503 because a pool was full", ("pool",))
+QUERY_LOG_ROWS = Counter("query_log_rows_total", "Query log rows written to the database")
+QUERY_LOG_DROPPED = Counter("query_log_dropped_rows_total", "Query log rows dead-lettered after repeated write failures")
+
+
+def stage(name: str):
+    """Time the ``with`` block as search stage ``name``."""
+    return STAGE_SECONDS.time(name)
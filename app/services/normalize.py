@@ -0,0 +1,67 @@
+# Copyright 2025 Leon Hecht
+# Licensed under the Apache License, Version 2.0 (see LICENSE file)
+
+"""
+Shared text normalization for indexing, snippets and queries.
+
+``normalize_token`` lowercases a token, strips accents and drops everything
+that is not an ASCII letter. Indexing applies the same steps to a whole
+document at once: the ``str.split()`` words are joined with single spaces,
+lowercased and NFD-decomposed in one call each, non-letters are removed with
+one precompiled regex, and the result is split on the spaces again. Words
+never contain whitespace and neither lowercasing nor NFD creates any, so
+every word maps to exactly the token ``normalize_token`` would return.
+"""
+
+import re
+import unicodedata
+from functools import lru_cache
+
+# Combining marks (category Mn) are removed by strip_accents
+_NON_LETTERS = re.compile(r'[^a-zA-Z]')
+_NON_LETTERS_OR_SPACE = re.compile(r'[^a-zA-Z ]+')
+
+
+class _CombiningMarks(dict):
+    """``str.translate`` table deleting Mn characters, filled in lazily."""
+
+    def __missing__(self, code: int):
+        if unicodedata.category(chr(code)) == 'Mn':
+            self[code] = None
+            return None
+        self[code] = code
+        return code
+
+
+_STRIP_MN = _CombiningMarks()
+
+
+# helper to strip accents
+def strip_accents(s: str) -> str:
+    return unicodedata.normalize('NFD', s).translate(_STRIP_MN)
+
+
+def normalize(text: str) -> str:
+    """Lowercase and strip accents, keeping every other character."""
+    return strip_accents(text.lower())
+
+
+# helper to normalize tokens: strip accents, lowercase, and drop non‐letters
+@lru_cache(maxsize=65536)
+def normalize_token(tok: str) -> str:
+    tok = strip_accents(tok.lower())
+    return _NON_LETTERS.sub('', tok)
+
+
+def normalize_tokens(text: str) -> list[str]:
+    """
+    Normalize every ``text.split()`` word of a document in one pass.
+
+    Equivalent to ``[normalize_token(w) for w in text.split()]``; empty
+    tokens are kept so positions line up with the words of ``text``.
+    """
+    words = text.split()
+    if not words:
+        return []
+    joined = unicodedata.normalize('NFD', ' '.join(words).lower())
+    return _NON_LETTERS_OR_SPACE.sub('', joined).split(' ')
@@ -0,0 +1,253 @@
+# Copyright 2025 Leon Hecht
+# Licensed under the Apache License, Version 2.0 (see LICENSE file)
+
+"""
+Write-behind logging of search queries.
+
+``/search`` must return its ``query_log_id`` but should not wait for a
+SQLite transaction to get it. `QueryLogWriter` therefore reserves IDs in
+blocks (one transaction on the ``QueryLogSequence`` row per block, safe
+across worker processes), assigns them to new ``QueryLog`` rows in memory
+and inserts the buffered rows in batched transactions from a background
+thread -- every ``flush_interval`` seconds or as soon as ``max_batch``
+rows are waiting. `close` drains the buffer on shutdown. Rows logged
+without a location are enriched with GeoIP data in that thread, so the
+lookup never adds latency to ``/search``.
+
+A failed batch is retried with the next flushes. Rows that have failed
+``max_attempts`` times are written one by one, so a single bad row cannot
+block the others, and rows that still fail are moved to a bounded
+dead-letter list and logged at error level.
+
+IDs left in a block when a worker stops are never used, so QueryLog IDs
+are unique and increasing per worker but may have gaps.
+"""
+
+import logging
+import threading
+from collections import deque
+
+from sqlalchemy import func, update
+from sqlalchemy.exc import IntegrityError
+from sqlmodel import Session, select
+
+from typing import Callable
+
+from app.config import (
+    QUERY_LOG_FLUSH_INTERVAL, QUERY_LOG_BATCH, QUERY_LOG_ID_BLOCK, QUERY_LOG_ATTEMPTS, QUERY_LOG_DEAD_LETTER,
+    GEOIP_BACKGROUND,
+)
+from app.db import engine
+from app.models.query_log import QueryLog, QueryLogSequence
+from app.services.logs import log_event
+from app.services.metrics import QUERY_LOG_DROPPED, QUERY_LOG_ROWS, stage
+from app.services.utils import locate_ip
+
+
+class QueryLogWriter:
+    """
+    Buffer QueryLog rows and insert them in batches.
+
+    Parameters
+    ----------
+    engine : sqlalchemy.engine.Engine
+        Database the rows are written to.
+    flush_interval : float
+        Maximum seconds a row waits in the buffer.
+    max_batch : int
+        Buffered rows that trigger an immediate flush.
+    id_block : int
+        Number of IDs reserved per database round trip.
+    enrich : Callable[[QueryLog], None] | None
+        Fills in missing fields of a row before it is written.
+    max_attempts : int
+        Failed flushes of a row before it is written on its own and, if
+        that fails too, dead-lettered.
+    dead_letter_size : int
+        Most recent dead-lettered rows kept in `dead_letter`.
+    """
+
+    def __init__(self, engine, flush_interval: float = 1.0, max_batch: int = 100, id_block: int = 1000,
+                 enrich: Callable[[QueryLog], None] | None = None, max_attempts: int = 3,
+                 dead_letter_size: int = 1000):
+        self.engine = engine
+        self.flush_interval = flush_interval
+        self.max_batch = max_batch
+        self.id_block = id_block
+        self.enrich = enrich
+        self.max_attempts = max(1, max_attempts)
+        # rows given up on, newest last
+        self.dead_letter: deque[QueryLog] = deque(maxlen=dead_letter_size)
+        self._lock = threading.Lock()
+        # serializes flushes from the thread, feedback and shutdown
+        self._flush_lock = threading.Lock()
+        self._next_id = 0
+        self._end_id = 0
+        # rows not committed yet, including the batch being written
+        self._pending: dict[int, QueryLog] = {}
+        self._buffer: list[QueryLog] = []
+        # failed flushes per pending row
+        self._attempts: dict[int, int] = {}
+        self._wake = threading.Event()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name="query-log-writer", daemon=True)
+        self._thread.start()
+
+    def _reserve_ids(self):
+        """Reserve the next block of IDs (caller holds ``_lock``)."""
+        for attempt in range(3):
+            try:
+                with Session(self.engine) as sess:
+                    # the increment takes the write lock, so blocks never overlap
+                    bumped = sess.execute(
+                        update(QueryLogSequence)
+                        .where(QueryLogSequence.name == "querylog")
+                        .values(next_id=QueryLogSequence.next_id + self.id_block)
+                    ).rowcount
+                    if not bumped:
+                        # first use: continue after the rows already in the table
+                        last = sess.execute(select(func.max(QueryLog.id))).scalar() or 0
+                        sess.add(QueryLogSequence(name="querylog", next_id=last + 1 + self.id_block))
+                    end = sess.execute(
+                        select(QueryLogSequence.next_id).where(QueryLogSequence.name == "querylog")
+                    ).scalar_one()
+                    sess.commit()
+                break
+            except IntegrityError:
+                # another worker created the sequence row first
+                if attempt == 2:
+                    raise
+        self._next_id, self._end_id = end - self.id_block, end
+
+    def log(self, **fields) -> int:
+        """Buffer a QueryLog row with the given fields and return its ID."""
+        with self._lock:
+            if self._next_id >= self._end_id:
+                self._reserve_ids()
+            row = QueryLog(id=self._next_id, **fields)
+            self._next_id += 1
+            self._pending[row.id] = row
+            self._buffer.append(row)
+            full = len(self._buffer) >= self.max_batch
+        if full:
+            self._wake.set()
+        return row.id
+
+    def is_pending(self, log_id: int) -> bool:
+        """True if the row ``log_id`` is logged but not committed yet."""
+        with self._lock:
+            return log_id in self._pending
+
+    def is_dead(self, log_id: int) -> bool:
+        """True if the row ``log_id`` was given up on and is in `dead_letter`."""
+        with self._lock:
+            return any(row.id == log_id for row in self.dead_letter)
+
+    def _insert(self, rows: list[QueryLog]):
+        with stage("db_log"), Session(self.engine, expire_on_commit=False) as sess:
+            sess.add_all(rows)
+            sess.commit()
+
+    def flush(self):
+        """Insert all buffered rows in one transaction."""
+        with self._flush_lock:
+            with self._lock:
+                batch, self._buffer = self._buffer, []
+            if not batch:
+                return
+            if self.enrich is not None:
+                for row in batch:
+                    self.enrich(row)
+            try:
+                self._insert(batch)
+            except Exception as exc:
+                log_event("query_log_error", logging.WARNING, rows=len(batch), error=str(exc))
+                self._retry_or_drop(batch)
+                return
+            self._written(batch)
+
+    def _retry_or_drop(self, batch: list[QueryLog]):
+        """Requeue a failed batch; rows out of attempts are written alone or dead-lettered."""
+        retry, exhausted = [], []
+        for row in batch:
+            self._attempts[row.id] = self._attempts.get(row.id, 0) + 1
+            (exhausted if self._attempts[row.id] >= self.max_attempts else retry).append(row)
+        with self._lock:
+            self._buffer[:0] = retry
+        for row in exhausted:
+            try:
+                self._insert([row])
+            except Exception as exc:
+                self._drop(row, str(exc))
+            else:
+                self._written([row])
+
+    def _drop(self, row: QueryLog, error: str):
+        """Give up on ``row``: log it and move it to the dead-letter list."""
+        log_event(
+            "query_log_dead_letter", logging.ERROR, id=row.id, query=row.query,
+            attempts=self._attempts.pop(row.id, 0), error=error,
+        )
+        QUERY_LOG_DROPPED.inc()
+        with self._lock:
+            self.dead_letter.append(row)
+            self._pending.pop(row.id, None)
+
+    def _written(self, rows: list[QueryLog]):
+        QUERY_LOG_ROWS.inc(amount=len(rows))
+        with self._lock:
+            for row in rows:
+                self._pending.pop(row.id, None)
+        for row in rows:
+            self._attempts.pop(row.id, None)
+
+    def _run(self):
+        while not self._closed:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            self.flush()
+
+    def close(self):
+        """
+        Stop the background thread and write the remaining rows.
+
+        Failed rows are retried until they run out of attempts, so every
+        buffered row ends up either written or dead-lettered.
+        """
+        if self._closed:
+            return
+        self._closed = True
+        self._wake.set()
+        self._thread.join()
+        for _ in range(self.max_attempts):
+            self.flush()
+            with self._lock:
+                if not self._buffer:
+                    return
+        with self._lock:
+            rows, self._buffer = self._buffer, []
+        for row in rows:
+            self._drop(row, "not written before shutdown")
+
+    def issued(self, log_id: int) -> bool:
+        """True if ``log_id`` was reserved by some worker, even if its row is not written yet."""
+        with Session(self.engine) as sess:
+            next_id = sess.execute(
+                select(QueryLogSequence.next_id).where(QueryLogSequence.name == "querylog")
+            ).scalar()
+        return next_id is not None and 0 < log_id < next_id
+
+
+def _locate(row: QueryLog):
+    """Fill in the country and city of rows logged without them."""
+    if row.country is None:
+        country, city = locate_ip(row.client_ip)
+        row.country = country or "Unknown"
+        row.city = city or "Unknown"
+
+
+QUERY_LOGGER = QueryLogWriter(
+    engine, QUERY_LOG_FLUSH_INTERVAL, QUERY_LOG_BATCH, QUERY_LOG_ID_BLOCK,
+    enrich=_locate if GEOIP_BACKGROUND else None,
+    max_attempts=QUERY_LOG_ATTEMPTS, dead_letter_size=QUERY_LOG_DEAD_LETTER,
+)
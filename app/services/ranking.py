@@ -0,0 +1,42 @@
+# Copyright 2025 Leon Hecht
+# Licensed under the Apache License, Version 2.0 (see LICENSE file)
+
+import numpy as np
+
+
+def top_k_indices(scores: np.ndarray, k: int, min_score: float = 0.0) -> np.ndarray:
+    """
+    Select the indices of the ``k`` best scores without sorting all of them.
+
+    Scores that are not strictly greater than ``min_score`` are dropped
+    first, the remaining candidates are cut down with ``argpartition`` and
+    only the winners are sorted. Ties are broken by ascending index, which
+    matches a stable descending sort over ``range(len(scores))``.
+
+    Parameters
+    ----------
+    scores : np.ndarray
+        One score per document.
+    k : int
+        Maximum number of indices to return.
+    min_score : float
+        Exclusive lower bound a score must exceed to be returned.
+
+    Returns
+    -------
+    np.ndarray
+        int64 indices ordered by descending score.
+    """
+    if k <= 0:
+        return np.empty(0, dtype=np.int64)
+    candidates = np.flatnonzero(scores > min_score)
+    if len(candidates) > k:
+        cand_scores = scores[candidates]
+        kth = cand_scores[np.argpartition(-cand_scores, k - 1)[k - 1]]
+        # keep everything above the k-th score, then fill with the
+        # lowest-index ties so the cut is deterministic
+        above = candidates[cand_scores > kth]
+        tied = candidates[cand_scores == kth][: k - len(above)]
+        candidates = np.concatenate([above, tied])
+    order = np.lexsort((candidates, -scores[candidates]))
+    return candidates[order]
@@ -0,0 +1,204 @@
+# Copyright 2025 Leon Hecht
+# Licensed under the Apache License, Version 2.0 (see LICENSE file)
+
+"""
+Versioned on-disk snapshots of the BM25 index.
+
+A snapshot is a directory ``<CORPUS_PATH>/.index/bm25-<fingerprint>`` with
+
+- ``manifest.json``: format version, corpus fingerprint and BM25 parameters,
+- one ``.npy`` file per index array (postings, statistics, tokenized corpus,
+  word offsets for snippets),
+- ``variants.json``: normalized term -> raw term ids, only for raw-token
+  (``.txt``) corpora,
+- ``vocab.bin``: newline separated terms in term id order,
+- ``docs.bin``: the documents as concatenated UTF-8 JSON records, sliced
+  through ``doc_offsets.npy``,
+- ``doc_ids.json``: the document ids in corpus order, so they are known
+  without decoding every document.
+
+Arrays and documents are memory-mapped on load, so every worker shares the
+same pages and nothing has to be re-tokenized while the corpus is unchanged.
+"""
+
+import hashlib
+import json
+import os
+import shutil
+from pathlib import Path
+
+import numpy as np
+
+from app.services.inverted_index import InvertedIndex
+from app.services.snippets import SnippetIndex
+
+SNAPSHOT_VERSION = 2
+_ARRAYS = ("indptr", "doc_ids", "tfs", "first_pos", "doc_len", "doc_terms", "idf", "norms")
+
+
+class DocStore:
+    """
+    Read-only, memory-mapped sequence of corpus documents.
+
+    Behaves like the in-memory list of ``{"id", "title", "text"}`` dicts:
+    documents are decoded on access, so only the hits of a query are parsed.
+    Documents added after loading (``store + docs``) are kept in memory.
+    """
+
+    def __init__(self, data: np.ndarray, offsets: np.ndarray, extra: list[dict] | None = None,
+                 ids: list[str] | None = None):
+        self._data = data
+        self._offsets = offsets
+        self._extra = extra or []
+        # ids of the mapped documents, if the snapshot has them
+        self._ids = ids
+
+    def __len__(self) -> int:
+        return len(self._offsets) - 1 + len(self._extra)
+
+    def __add__(self, docs: list[dict]) -> "DocStore":
+        return DocStore(self._data, self._offsets, self._extra + list(docs), self._ids)
+
+    def ids(self) -> list[str]:
+        """Ids of all documents, decoding them only if the snapshot has no id list."""
+        if self._ids is None:
+            mapped = [self[i]["id"] for i in range(len(self._offsets) - 1)]
+        else:
+            mapped = list(self._ids)
+        return mapped + [doc["id"] for doc in self._extra]
+
+    def __getitem__(self, i: int) -> dict:
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError("document index out of range")
+        n_mapped = len(self._offsets) - 1
+        if i >= n_mapped:
+            return self._extra[i - n_mapped]
+        start, end = self._offsets[i], self._offsets[i + 1]
+        return json.loads(self._data[start:end].tobytes())
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+
+def snapshot_root(corpus_path: str) -> Path:
+    """Directory that holds the snapshots of ``corpus_path``."""
+    return Path(corpus_path) / ".index"
+
+
+def corpus_fingerprint(corpus_path: str) -> str:
+    """
+    Hash identifying the current corpus contents.
+
+    Uses the bytes of ``corpus.jsonl`` when present; otherwise the relative
+    path, size and modification time of every ``.txt`` file.
+    """
+    h = hashlib.sha256()
+    root = Path(corpus_path)
+    jsonl_file = root / "corpus.jsonl"
+    if jsonl_file.exists():
+        with jsonl_file.open("rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                h.update(chunk)
+    else:
+        for file in sorted(root.glob("**/*.txt")):
+            st = file.stat()
+            h.update(f"{file.relative_to(root)}\0{st.st_size}\0{st.st_mtime_ns}\n".encode("utf-8"))
+    return h.hexdigest()
+
+
+def _snapshot_dir(corpus_path: str, fingerprint: str) -> Path:
+    return snapshot_root(corpus_path) / f"bm25-{fingerprint[:16]}"
+
+
+def load_snapshot(corpus_path: str, fingerprint: str):
+    """
+    Map the snapshot matching ``fingerprint``.
+
+    Returns
+    -------
+    tuple[DocStore, InvertedIndex, SnippetIndex] | None
+        ``None`` when no compatible snapshot exists.
+    """
+    path = _snapshot_dir(corpus_path, fingerprint)
+    try:
+        manifest = json.loads((path / "manifest.json").read_text(encoding="utf-8"))
+    except (OSError, json.JSONDecodeError):
+        return None
+    if manifest.get("version") != SNAPSHOT_VERSION or manifest.get("fingerprint") != fingerprint:
+        return None
+
+    arrays = {name: np.load(path / f"{name}.npy", mmap_mode="r") for name in _ARRAYS}
+    terms = (path / "vocab.bin").read_bytes().decode("utf-8").split("\n")
+    vocab = {t: i for i, t in enumerate(terms[: manifest["n_terms"]])}
+    index = InvertedIndex(
+        vocab, k1=manifest["k1"], b=manifest["b"], epsilon=manifest["epsilon"], **arrays,
+    )
+    variants = None
+    if (path / "variants.json").exists():
+        variants = json.loads((path / "variants.json").read_text(encoding="utf-8"))
+    snippets = SnippetIndex(index, np.load(path / "word_offsets.npy", mmap_mode="r"), variants)
+    ids = None
+    if (path / "doc_ids.json").exists():
+        ids = json.loads((path / "doc_ids.json").read_text(encoding="utf-8"))
+    docs = DocStore(
+        np.memmap(path / "docs.bin", dtype=np.uint8, mode="r"),
+        np.load(path / "doc_offsets.npy", mmap_mode="r"),
+        ids=ids,
+    )
+    return docs, index, snippets
+
+
+def save_snapshot(corpus_path: str, fingerprint: str, corpus, index: InvertedIndex,
+                  snippets: SnippetIndex) -> None:
+    """
+    Write a snapshot of ``corpus``, ``index`` and ``snippets`` and drop older ones.
+
+    The snapshot is written to a temporary directory and renamed into place,
+    so concurrent readers only ever see complete snapshots.
+    """
+    if not len(corpus):
+        return
+    final = _snapshot_dir(corpus_path, fingerprint)
+    if final.exists():
+        return
+    tmp = final.with_name(f"{final.name}.tmp-{os.getpid()}")
+    shutil.rmtree(tmp, ignore_errors=True)
+    tmp.mkdir(parents=True)
+
+    for name in _ARRAYS:
+        np.save(tmp / f"{name}.npy", np.asarray(getattr(index, name)))
+    (tmp / "vocab.bin").write_bytes("\n".join(index.vocab).encode("utf-8"))
+    np.save(tmp / "word_offsets.npy", np.asarray(snippets.offsets))
+    if snippets.variants is not None:
+        (tmp / "variants.json").write_text(json.dumps(snippets.variants), encoding="utf-8")
+
+    offsets = np.zeros(len(corpus) + 1, dtype=np.int64)
+    with (tmp / "docs.bin").open("wb") as f:
+        for i, doc in enumerate(corpus):
+            offsets[i + 1] = offsets[i] + f.write(json.dumps(doc, ensure_ascii=False).encode("utf-8"))
+    np.save(tmp / "doc_offsets.npy", offsets)
+    (tmp / "doc_ids.json").write_text(json.dumps([doc["id"] for doc in corpus]), encoding="utf-8")
+
+    manifest = {
+        "version": SNAPSHOT_VERSION,
+        "fingerprint": fingerprint,
+        "n_docs": len(corpus),
+        "n_terms": len(index.vocab),
+        "k1": index.k1,
+        "b": index.b,
+        "epsilon": index.epsilon,
+    }
+    (tmp / "manifest.json").write_text(json.dumps(manifest, indent=2), encoding="utf-8")
+
+    try:
+        tmp.rename(final)
+    except OSError:
+        # another worker published the same snapshot first
+        shutil.rmtree(tmp, ignore_errors=True)
+        return
+    for old in snapshot_root(corpus_path).glob("bm25-*"):
+        if old != final and ".tmp-" not in old.name:
+            shutil.rmtree(old, ignore_errors=True)
@@ -0,0 +1,129 @@
+# Copyright 2025 Leon Hecht
+# Licensed under the Apache License, Version 2.0 (see LICENSE file)
+
+"""
+Snippet extraction from precomputed token positions.
+
+A snippet is the 50-word window around the first word of a document whose
+normalized form is one of the query terms (starting at most 25 words
+before it). Instead of splitting and normalizing the document text for
+every hit, the first match is read from the ``first_pos`` postings of the
+BM25 index and the window is sliced out of the text through the character
+offset of every word, which is recorded at index time.
+"""
+
+import re
+from typing import Callable
+
+import numpy as np
+
+from app.services.inverted_index import InvertedIndex
+
+SNIPPET_WORDS = 50
+SNIPPET_BEFORE = 25
+
+# same word boundaries as str.split()
+_WORD = re.compile(r"\S+")
+
+
+def word_offsets(text: str) -> np.ndarray:
+    """Character offset of every ``text.split()`` word."""
+    return np.fromiter((m.start() for m in _WORD.finditer(text)), dtype=np.int32)
+
+
+def _add_variants(variants: dict[str, list[int]], terms, normalize) -> dict[str, list[int]]:
+    for term, t in terms:
+        variants.setdefault(normalize(term), []).append(t)
+    return variants
+
+
+class SnippetIndex:
+    """
+    Word offsets of every document plus the term mapping for snippet lookup.
+
+    Attributes
+    ----------
+    index : InvertedIndex
+        Index whose token positions the offsets are aligned with.
+    offsets : np.ndarray
+        int32 character offset of every token of ``index.doc_terms``.
+    variants : dict[str, list[int]] | None
+        Normalized term -> ids of the index terms that normalize to it.
+        None when the index terms are already normalized.
+    """
+
+    def __init__(self, index: InvertedIndex, offsets: np.ndarray,
+                 variants: dict[str, list[int]] | None = None):
+        self.index = index
+        self.offsets = offsets
+        self.variants = variants
+        self.doc_start = np.cumsum(index.doc_len, dtype=np.int64) - index.doc_len
+
+    @classmethod
+    def build(cls, index: InvertedIndex, texts, normalize: Callable[[str], str] | None = None):
+        """
+        Build the snippet index for ``index`` over the given document texts.
+
+        Parameters
+        ----------
+        index : InvertedIndex
+            Index built from ``text.split()`` of every text.
+        texts : Iterable[str]
+            Document texts, in index order.
+        normalize : Callable[[str], str] | None
+            Token normalizer, only needed when the index holds raw tokens.
+        """
+        offsets = [word_offsets(text) for text in texts]
+        flat = np.concatenate(offsets) if offsets else np.zeros(0, dtype=np.int32)
+        return cls.from_offsets(index, flat, normalize)
+
+    @classmethod
+    def from_offsets(cls, index: InvertedIndex, offsets: np.ndarray,
+                     normalize: Callable[[str], str] | None = None):
+        """Like `build`, with the word offsets already computed."""
+        variants = None
+        if normalize is not None:
+            variants = _add_variants({}, index.vocab.items(), normalize)
+        return cls(index, offsets, variants)
+
+    def extended(self, index: InvertedIndex, texts, normalize: Callable[[str], str] | None = None):
+        """Snippet index for ``index``, which appended documents with ``texts``."""
+        offsets = np.concatenate([self.offsets] + [word_offsets(text) for text in texts])
+        variants = None
+        if self.variants is not None:
+            new_terms = list(index.vocab.items())[len(self.index.vocab):]
+            variants = {term: list(ids) for term, ids in self.variants.items()}
+            _add_variants(variants, new_terms, normalize)
+        return SnippetIndex(index, offsets, variants)
+
+    def first_match(self, doc: int, terms) -> int | None:
+        """Word position of the first occurrence of any of ``terms`` in ``doc``."""
+        best = None
+        for term in set(terms):
+            if self.variants is None:
+                t = self.index.vocab.get(term)
+                term_ids = () if t is None else (t,)
+            else:
+                term_ids = self.variants.get(term, ())
+            for t in term_ids:
+                pos = self.index.first_position(t, doc)
+                if pos is not None and (best is None or pos < best):
+                    best = pos
+        return best
+
+    def snippet(self, doc: int, text: str, terms) -> str:
+        """
+        Return the snippet of document ``doc`` for the normalized ``terms``.
+
+        Equivalent to scanning ``text.split()`` for the first word whose
+        normalized form is in ``terms``; empty string if there is none.
+        """
+        pos = self.first_match(doc, terms)
+        if pos is None:
+            return ""
+        start = max(pos - SNIPPET_BEFORE, 0)
+        end = start + SNIPPET_WORDS
+        base = self.doc_start[doc]
+        first_char = self.offsets[base + start]
+        last_char = self.offsets[base + end] if end < self.index.doc_len[doc] else len(text)
+        return " ".join(text[first_char:last_char].split())
@@ -0,0 +1,151 @@
+# Copyright 2025 Leon Hecht
+# Licensed under the Apache License, Version 2.0 (see LICENSE file)
+
+"""
+Learned-sparse retrieval over BGE-M3 lexical weights.
+
+Besides the dense vector, BGE-M3 returns one weight per distinct token of a
+text (its "lexical weights") from the same forward pass. The relevance of
+a document is the sum, over the tokens it shares with the query, of the
+products of their weights.
+
+``SparseRows`` holds the weights of the corpus one document after the
+other (CSR), in the order of the embedding rows. ``SparseIndex`` is its
+transpose: one posting list of ``(document, weight)`` pairs per token, so
+a query only touches the postings of its own tokens instead of every
+document. The embedding cache persists the index as ``.npy`` arrays that
+workers map read-only, like the embedding matrix.
+"""
+
+from pathlib import Path
+
+import numpy as np
+
+from app.services.arrays import save_npy
+
+_ARRAYS = ("vocab", "indptr", "doc_ids", "weights")
+
+
+def lexical_terms(weights: dict) -> tuple[np.ndarray, np.ndarray]:
+    """Convert one ``{token id: weight}`` dict into ``(terms, weights)`` arrays."""
+    terms = np.fromiter((int(t) for t in weights), dtype=np.int32, count=len(weights))
+    values = np.fromiter(weights.values(), dtype=np.float32, count=len(weights))
+    order = np.argsort(terms)
+    return terms[order], values[order]
+
+
+class SparseRows:
+    """
+    Lexical weights of a corpus in CSR form, one row per document.
+
+    Attributes
+    ----------
+    indptr : np.ndarray
+        int64 ``(n + 1,)`` start of every row in ``terms`` and ``weights``.
+    terms : np.ndarray
+        int32 token IDs, ascending within a row.
+    weights : np.ndarray
+        float32 weight of every token.
+    """
+
+    def __init__(self, indptr: np.ndarray, terms: np.ndarray, weights: np.ndarray):
+        self.indptr = indptr
+        self.terms = terms
+        self.weights = weights
+
+    def __len__(self) -> int:
+        return len(self.indptr) - 1
+
+    @classmethod
+    def from_rows(cls, rows: list[tuple[np.ndarray, np.ndarray]]) -> "SparseRows":
+        """Stack ``(terms, weights)`` pairs, one per document."""
+        lengths = np.fromiter((len(t) for t, _ in rows), dtype=np.int64, count=len(rows))
+        indptr = np.concatenate([[0], np.cumsum(lengths)]).astype(np.int64)
+        if not rows:
+            return cls(indptr, np.zeros(0, dtype=np.int32), np.zeros(0, dtype=np.float32))
+        terms = np.concatenate([t for t, _ in rows]).astype(np.int32, copy=False)
+        weights = np.concatenate([w for _, w in rows]).astype(np.float32, copy=False)
+        return cls(indptr, terms, weights)
+
+    @classmethod
+    def from_weights(cls, lexical_weights: list[dict]) -> "SparseRows":
+        """Build rows from the ``lexical_weights`` output of BGE-M3."""
+        return cls.from_rows([lexical_terms(w) for w in lexical_weights])
+
+    def row(self, i: int) -> tuple[np.ndarray, np.ndarray]:
+        """Tokens and weights of document ``i``."""
+        start, stop = self.indptr[i], self.indptr[i + 1]
+        return self.terms[start:stop], self.weights[start:stop]
+
+
+class SparseIndex:
+    """
+    Posting lists of lexical weights, one per token.
+
+    Attributes
+    ----------
+    vocab : np.ndarray
+        int32 sorted token IDs that occur in the corpus.
+    indptr : np.ndarray
+        int64 ``(len(vocab) + 1,)`` start of every posting list.
+    doc_ids : np.ndarray
+        int32 documents of the postings, ascending within a list.
+    weights : np.ndarray
+        float32 document weight of the token in every posting.
+    n_docs : int
+        Number of documents.
+    """
+
+    def __init__(self, vocab, indptr, doc_ids, weights, n_docs: int):
+        self.vocab = vocab
+        self.indptr = indptr
+        self.doc_ids = doc_ids
+        self.weights = weights
+        self.n_docs = n_docs
+
+    @classmethod
+    def from_rows(cls, rows: SparseRows) -> "SparseIndex":
+        """Transpose per-document rows into per-token posting lists."""
+        docs = np.repeat(np.arange(len(rows), dtype=np.int32), np.diff(rows.indptr))
+        # stable sort keeps the documents of a token in ascending order
+        order = np.argsort(rows.terms, kind="stable")
+        terms = rows.terms[order]
+        vocab, starts = np.unique(terms, return_index=True)
+        indptr = np.append(starts, len(terms)).astype(np.int64)
+        return cls(vocab, indptr, docs[order], rows.weights[order], len(rows))
+
+    def to_rows(self) -> SparseRows:
+        """Transpose the posting lists back into per-document rows."""
+        terms = np.repeat(self.vocab, np.diff(self.indptr))
+        # postings are ordered by token, so a stable sort keeps tokens ascending per document
+        order = np.argsort(self.doc_ids, kind="stable")
+        indptr = np.zeros(self.n_docs + 1, dtype=np.int64)
+        np.cumsum(np.bincount(self.doc_ids, minlength=self.n_docs), out=indptr[1:])
+        return SparseRows(indptr, terms[order].astype(np.int32), np.asarray(self.weights)[order])
+
+    def save(self, prefix: Path):
+        """Write the arrays to ``<prefix>.<name>.npy`` atomically."""
+        for name in _ARRAYS:
+            save_npy(prefix.with_name(f"{prefix.name}.{name}.npy"), np.asarray(getattr(self, name)))
+
+    @classmethod
+    def load(cls, prefix: Path, n_docs: int) -> "SparseIndex":
+        """Map an index saved by `save` read-only."""
+        arrays = [np.load(prefix.with_name(f"{prefix.name}.{name}.npy"), mmap_mode="r") for name in _ARRAYS]
+        index = cls(*arrays, n_docs)
+        if len(index.indptr) != len(index.vocab) + 1 or len(index.doc_ids) != len(index.weights):
+            raise ValueError(f"{prefix} holds an incomplete sparse index")
+        return index
+
+    def get_scores(self, terms: np.ndarray, weights: np.ndarray) -> np.ndarray:
+        """Lexical matching score of every document for a query's tokens."""
+        scores = np.zeros(self.n_docs, dtype=np.float32)
+        pos = np.searchsorted(self.vocab, terms)
+        for p, term, weight in zip(pos, terms, weights):
+            if p == len(self.vocab) or self.vocab[p] != term:
+                continue
+            start, stop = self.indptr[p], self.indptr[p + 1]
+            # a document occurs at most once per posting list
+            scores[self.doc_ids[start:stop]] += weight * self.weights[start:stop]
+        return scores
+
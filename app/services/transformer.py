@@ -1,120 +1,196 @@
 # Copyright 2025 Leon Hecht
 # Licensed under the Apache License, Version 2.0 (see LICENSE file)
 
-import os
 import threading
-from pathlib import Path
-import json
 import numpy as np
-import unicodedata
-import re
 from FlagEmbedding import BGEM3FlagModel
-from app.config import CORPUS_PATH
+from app.config import (
+    CORPUS_PATH, VECTOR_INDEX, IVF_NLIST, IVF_NPROBE, VECTOR_QUANTIZATION, VECTOR_RESCORE,
+    QUERY_CACHE_SIZE, QUERY_CACHE_TTL, QUERY_CACHE_PERSIST, QUERY_BATCH_SIZE, QUERY_BATCH_WAIT_MS, SPARSE_INDEX,
+)
+from app.services.batching import MicroBatcher
+from app.services.cache import EmbeddingStore, LRUCache, RESULT_CACHE
+from app.services.hits import build_hits, snippet_terms
+from app.services.embedding_cache import load_embeddings
+from app.services.vector_index import FlatIndex, IVFIndex, load_vector_index
+from app.services.sparse_index import SparseIndex, lexical_terms
+from app.services.snapshot import snapshot_root
+from app.services.bm25 import current_generation
+from app.services.generation import IndexGeneration
+from app.services.normalize import normalize, normalize_token
+from app.services.metrics import stage
+from app.services.ranking import top_k_indices
+
+MODEL_NAME = 'BAAI/bge-m3'
+MAX_LENGTH = 2048
 
 _lock = threading.Lock()
 _MODEL = None
-_CORPUS: list[dict] = []
-_CORPUS_EMBS: np.ndarray | None = None
-
-def strip_accents(s: str) -> str:
-    return ''.join(
-        c for c in unicodedata.normalize('NFD', s)
-        if unicodedata.category(c) != 'Mn'
-    )
-
-def normalize(text: str) -> str:
-    return strip_accents(text.lower())
-
-# helper to normalize tokens: strip accents, lowercase, and drop non‐letters
-def normalize_token(tok: str) -> str:
-    tok = strip_accents(tok.lower())
-    return re.sub(r'[^a-zA-Z]', '', tok)
+# collects concurrent query encodings into batched model calls
+_ENCODER: MicroBatcher | None = None
+# BM25 generation whose corpus the embedding rows are aligned with,
+# published together with the vector index over the embeddings and the
+# postings of the lexical weights (None unless SPARSE_INDEX is on)
+_CORPUS_STATE: tuple[IndexGeneration, FlatIndex | IVFIndex, SparseIndex | None] | None = None
+# query embeddings keyed on (model, normalized query); the optional SQLite
+# tier is shared by all workers and survives restarts
+_QUERY_CACHE = LRUCache(QUERY_CACHE_SIZE, QUERY_CACHE_TTL)
+_QUERY_STORE = None
+if QUERY_CACHE_PERSIST:
+    _QUERY_STORE = EmbeddingStore(snapshot_root(CORPUS_PATH) / "embeddings" / "queries.sqlite", QUERY_CACHE_TTL)
 
 def load_transformer_corpus():
-    """Load the BM25 corpus JSONL, extract texts, and embed them."""
-    global _MODEL, _CORPUS, _CORPUS_EMBS
+    """
+    Embed the documents of the current BM25 generation (cached on disk).
+
+    Sharing the BM25 corpus keeps embedding rows aligned with the BM25
+    positions, so snippets come from the same positional index.
+    """
+    global _MODEL, _ENCODER, _CORPUS_STATE
     with _lock:
         # Initialize model once
         if _MODEL is None:
-            _MODEL = BGEM3FlagModel('BAAI/bge-m3', use_fp16=True)
-
-        # Load documents
-        _CORPUS.clear()
-        jsonl_file = Path(CORPUS_PATH) / "corpus.jsonl"
-        with jsonl_file.open(encoding="utf-8") as f:
-            for line in f:
-                obj = json.loads(line)
-                doc_id = obj['id']
-                title  = obj.get('title','')
-                text   = obj.get('text','')
-                full   = f"{title} {text}".strip()
-                # normalize accents
-                full_norm = normalize(full)
-
-                _CORPUS.append({
-                    "id": doc_id,
-                    "title": title,
-                    "text_norm": full_norm,
-                    "text": full
-                })                
-
-        # Compute embeddings in batch
-        texts = [doc["text_norm"] for doc in _CORPUS]
-        res = _MODEL.encode(texts, batch_size=8, max_length=2048)
-        _CORPUS_EMBS = np.vstack(res['dense_vecs']).astype('float32')
+            _MODEL = BGEM3FlagModel(MODEL_NAME, use_fp16=True)
+        if _ENCODER is None and QUERY_BATCH_SIZE > 1:
+            _ENCODER = MicroBatcher(_encode_queries, QUERY_BATCH_SIZE, QUERY_BATCH_WAIT_MS / 1000, "query-encoder")
+
+        gen = current_generation()
+        # another request may have loaded this generation while we waited
+        if _CORPUS_STATE is not None and _CORPUS_STATE[0] is gen:
+            return
+
+        # normalize accents
+        texts = [normalize(doc["text"]) for doc in gen.corpus]
+
+        # Map cached embeddings and only encode new or changed documents;
+        # the lexical weights come from the same encoding pass
+        cache_dir = snapshot_root(CORPUS_PATH) / "embeddings"
+        embs = load_embeddings(
+            cache_dir,
+            texts,
+            MODEL_NAME,
+            MAX_LENGTH,
+            _encode_corpus,
+            sparse=SPARSE_INDEX,
+        )
+        sparse = None
+        if SPARSE_INDEX:
+            embs, sparse = embs
+        vectors = load_vector_index(
+            VECTOR_INDEX, cache_dir, embs, IVF_NLIST, IVF_NPROBE, VECTOR_QUANTIZATION, VECTOR_RESCORE,
+        )
+        _CORPUS_STATE = (gen, vectors, sparse)
+
+
+def corpus_state() -> tuple[IndexGeneration, FlatIndex | IVFIndex, SparseIndex | None]:
+    """Return the embedded generation, its vector index and lexical postings, loading them once."""
+    if _MODEL is None or _CORPUS_STATE is None:
+        load_transformer_corpus()
+    return _CORPUS_STATE
+
+
+def _encode_corpus(texts: list[str]):
+    res = _MODEL.encode(texts, batch_size=8, max_length=MAX_LENGTH, return_sparse=SPARSE_INDEX)
+    dense = np.vstack(res['dense_vecs']).astype('float32')
+    return (dense, res['lexical_weights']) if SPARSE_INDEX else dense
+
+def _encode_queries(texts: list[str]) -> np.ndarray:
+    return np.asarray(_MODEL.encode(texts)['dense_vecs'], dtype=np.float32)
+
+
+def encode_query(q_norm: str) -> np.ndarray:
+    """Embed a normalized query, skipping the model for repeated queries."""
+    key = (MODEL_NAME, q_norm)
+    q_emb = _QUERY_CACHE.get(key)
+    if q_emb is not None:
+        return q_emb
+    if _QUERY_STORE is not None:
+        q_emb = _QUERY_STORE.get(MODEL_NAME, q_norm)
+    if q_emb is None:
+        q_emb = _ENCODER(q_norm) if _ENCODER is not None else _encode_queries([q_norm])[0]
+        if _QUERY_STORE is not None:
+            _QUERY_STORE.put(MODEL_NAME, q_norm, q_emb)
+    # shared between requests, so it must not be modified
+    q_emb.setflags(write=False)
+    _QUERY_CACHE.put(key, q_emb)
+    return q_emb
+
+
+def encode_sparse_query(q_norm: str) -> tuple[np.ndarray, np.ndarray]:
+    """Lexical weights of a normalized query as ``(terms, weights)``, cached in memory."""
+    key = (MODEL_NAME, "sparse", q_norm)
+    encoded = _QUERY_CACHE.get(key)
+    if encoded is None:
+        res = _MODEL.encode([q_norm], return_dense=False, return_sparse=True)
+        encoded = lexical_terms(res['lexical_weights'][0])
+        for arr in encoded:
+            arr.setflags(write=False)
+        _QUERY_CACHE.put(key, encoded)
+    return encoded
+
+
+def query_cache_stats() -> dict:
+    """Hit/miss counters of the query embedding cache tiers and batch sizes."""
+    return {
+        "memory": _QUERY_CACHE.stats(),
+        "persistent": _QUERY_STORE.stats() if _QUERY_STORE is not None else None,
+        "batching": _ENCODER.stats() if _ENCODER is not None else None,
+    }
+
 
 def transformer_search(query: str, top_k: int = 30) -> list[dict]:
     """Return top_k by dot-product similarity between query and corpus embeddings."""
-    if _MODEL is None or _CORPUS_EMBS is None:
-        load_transformer_corpus()
+    gen, vectors, _ = corpus_state()
+    if not len(gen.corpus):
+        return []
+
+    with stage("tokenize"):
+        q_norm = normalize(query)
+    cache_key = ("semantica", q_norm, top_k, gen.number)
+    cached = RESULT_CACHE.get(cache_key)
+    if cached is not None:
+        return [dict(hit) for hit in cached]
+    with stage("encode"):
+        q_emb = encode_query(q_norm)  # single embedding, cached
+    # keep only the top_k positive similarities (exact or approximate)
+    with stage("score"):
+        idxs, sims = vectors.search(q_emb, top_k)
+
+    tokenized_query = [normalize_token(tok) for tok in q_norm.split()]
+    results = build_hits(gen, idxs, sims, snippet_terms(tokenized_query))
+
+    RESULT_CACHE.put(cache_key, results)
+    return [dict(hit) for hit in results]
+
+
+def sparse_search(query: str, top_k: int = 30) -> list[dict]:
+    """
+    Return top_k by learned-sparse (lexical weight) matching with the query.
+
+    Only the posting lists of the query's tokens are read. Hits have the
+    same fields as `transformer_search`. Requires SPARSE_INDEX.
+    """
+    gen, _, sparse = corpus_state()
+    if sparse is None:
+        raise RuntimeError("Sparse retrieval needs SPARSE_INDEX=1")
+    if not len(gen.corpus):
+        return []
 
-    q_norm = normalize(query)
-    q_emb = _MODEL.encode([q_norm])['dense_vecs'][0]  # single embedding
-    # compute similarity
-    sims = _CORPUS_EMBS @ q_emb
-    # sort by similarity, keep only top_k
-    idxs = np.argsort(-sims)
-    idxs = [i for i in idxs if sims[i] > 0][:top_k]
+    with stage("tokenize"):
+        q_norm = normalize(query)
+    cache_key = ("dispersa", q_norm, top_k, gen.number)
+    cached = RESULT_CACHE.get(cache_key)
+    if cached is not None:
+        return [dict(hit) for hit in cached]
+    with stage("encode"):
+        terms, weights = encode_sparse_query(q_norm)
+    with stage("score"):
+        scores = sparse.get_scores(terms, weights)
+    with stage("topk"):
+        idxs = top_k_indices(scores, top_k)
+    scores = scores[idxs]
 
-    results = []
     tokenized_query = [normalize_token(tok) for tok in q_norm.split()]
-    tokenized_query_cleaned = [tok for tok in tokenized_query if len(tok) > 3]
-    if len(tokenized_query_cleaned) > 0:
-        tokenized_query = tokenized_query_cleaned
-        
-    for i in idxs:
-        doc = _CORPUS[i]
-        text = doc['text']
-
-        # find first exact match of any query term and take 50-word window
-        snippet = ""
-        doc_tokens = text.split()
-        for idx, orig_tok in enumerate(doc_tokens):
-            if normalize_token(orig_tok) in tokenized_query:
-                start = max(idx - 25, 0)
-                snippet_tokens = doc_tokens[start : start + 50]
-                snippet = " ".join(snippet_tokens)
-                break
-        
-        if snippet == "":
-            print(f"Warning: No snippet found for document ID {doc['id']}")
-            
-        # detect the actual file extension (pdf, html, docx, etc.)
-        file_url = None
-        for ext in (".pdf", ".PDF", ".htm", ".html", ".HTML", ".docx", ".doc", ".txt"):
-            candidate = Path(CORPUS_PATH) / "files" / f"{doc['id']}{ext}"
-            if candidate.exists():
-                file_url = f"/files/{candidate.name}"
-                break
-        if file_url is None:
-            print(f"Warning: No file found for document ID {doc['id']}")
-        
-        results.append({
-            "id": doc["id"],
-            "title": doc["title"],
-            "score": float(sims[i]),
-            "snippet": snippet,
-            "download_url": file_url,
-        })
-
-    return results
\ No newline at end of file
+    results = build_hits(gen, idxs, scores, snippet_terms(tokenized_query))
+    RESULT_CACHE.put(cache_key, results)
+    return [dict(hit) for hit in results]
@@ -1,27 +1,61 @@
 # Copyright 2025 Leon Hecht
 # Licensed under the Apache License, Version 2.0 (see LICENSE file)
 
+import ipaddress
 import geoip2.database
-import os
-from app.config import GEOIP_CITY_DB, GEOIP_COUNTRY_DB
+import geoip2.errors
+from app.config import GEOIP_CITY_DB, GEOIP_MMAP, GEOIP_CACHE_SIZE, GEOIP_CACHE_PREFIX
+from app.services.cache import LRUCache
+from app.services.logs import log_event
+from app.services.metrics import stage
 
-# point to where you placed the DB file
-_reader_country = geoip2.database.Reader(GEOIP_COUNTRY_DB)
-_reader_city = geoip2.database.Reader(GEOIP_CITY_DB)
+# point to where you placed the DB file; the city database also holds the
+# country, so a single reader and lookup serve both fields
+_reader_city = geoip2.database.Reader(
+    GEOIP_CITY_DB,
+    mode=geoip2.database.MODE_MMAP if GEOIP_MMAP else geoip2.database.MODE_AUTO,
+)
+# (country, city) per IP, or per /24 (IPv4) and /48 (IPv6) network
+_locations = LRUCache(GEOIP_CACHE_SIZE)
+_MISSING = object()
 
-def country_from_ip(ip: str) -> str | None:
+
+def _cache_key(ip: str) -> str:
+    if not GEOIP_CACHE_PREFIX:
+        return ip
     try:
-        resp = _reader_country.country(ip)
-        return resp.country.iso_code  # e.g. "US", "PY"
-    except geoip2.errors.AddressNotFoundError:
-        return None
+        addr = ipaddress.ip_address(ip)
+    except ValueError:
+        return ip
+    prefix = 24 if addr.version == 4 else 48
+    return str(ipaddress.ip_network(f"{addr}/{prefix}", strict=False))
 
-def city_from_ip(ip: str) -> str | None:
+
+def locate_ip(ip: str) -> tuple[str | None, str | None]:
+    """Return ``(country ISO code, city name)`` of ``ip`` with one lookup."""
+    with stage("geoip"):
+        return _locate(ip)
+
+
+def _locate(ip: str) -> tuple[str | None, str | None]:
+    key = _cache_key(ip)
+    location = _locations.get(key, _MISSING)
+    if location is not _MISSING:
+        return location
     try:
         resp = _reader_city.city(ip)
-        return resp.city.name  # e.g. "Asuncion"
-    except geoip2.errors.AddressNotFoundError:
-        return None
+        location = (resp.country.iso_code, resp.city.name)  # e.g. ("PY", "Asuncion")
+    except (geoip2.errors.AddressNotFoundError, ValueError):
+        # unknown or not an IP address (e.g. a test client)
+        location = (None, None)
     except geoip2.errors.GeoIP2Error as e:
-        print(f"GeoIP error for {ip}: {e}")
-        return None
\ No newline at end of file
+        log_event("geoip_error", ip=ip, error=str(e))
+        return None, None
+    _locations.put(key, location)
+    return location
+
+def country_from_ip(ip: str) -> str | None:
+    return locate_ip(ip)[0]  # e.g. "US", "PY"
+
+def city_from_ip(ip: str) -> str | None:
+    return locate_ip(ip)[1]  # e.g. "Asuncion"
@@ -0,0 +1,434 @@
+# Copyright 2025 Leon Hecht
+# Licensed under the Apache License, Version 2.0 (see LICENSE file)
+
+"""
+Vector indexes for semantic search.
+
+``FlatIndex`` scores every document against the query and is exact.
+``IVFIndex`` (inverted file) clusters the corpus vectors with spherical
+k-means and only scores the documents of the ``nprobe`` clusters whose
+centroids are closest to the query. ``nlist`` (number of clusters) and
+``nprobe`` trade recall for speed: scanning all clusters is exact, a
+handful of them touches only a small fraction of the corpus.
+
+Both indexes can scan compact quantized codes instead of the float32
+vectors: ``Int8Codes`` (one byte per dimension, 4x smaller) or
+``BinaryCodes`` (one sign bit per dimension, 32x smaller). The code scan
+picks a shortlist of ``rescore * k`` documents that are then rescored with
+their exact float vectors, so only the shortlisted rows of the
+memory-mapped embedding matrix are ever paged in. Binary codes are also
+faster to scan than the float vectors; int8 codes are not, because numpy
+has no BLAS kernel for integer products and they are widened to float32
+block by block.
+
+The IVF structure and the codes are persisted next to the embedding cache
+as ``ivf-<nlist>-<token>.npz`` and ``<quantization>-<token>.npy``, where
+``<token>`` names the embedding matrix they were derived from, so they are
+rebuilt exactly when the embeddings change.
+"""
+
+import fcntl
+import math
+import os
+from pathlib import Path
+
+import numpy as np
+
+from app.services.arrays import save_npy
+from app.services.ranking import top_k_indices
+
+VECTOR_INDEX_KINDS = ("flat", "ivf")
+QUANTIZATIONS = ("none", "int8", "binary")
+
+# rows scored per block when assigning vectors or scanning codes
+_ASSIGN_BLOCK = 16384
+# int8 rows widened to float32 at a time during a code scan
+_INT8_BLOCK = 256
+# training sample size per cluster
+_SAMPLE_PER_LIST = 256
+
+
+class Int8Codes:
+    """
+    Scalar-quantized vectors: one int8 per dimension.
+
+    Every dimension is scaled symmetrically by its largest absolute value,
+    so ``codes * scale`` approximates the float vectors.
+
+    Attributes
+    ----------
+    codes : np.ndarray
+        int8 ``(n, dim)`` codes.
+    scale : np.ndarray
+        float32 ``(dim,)`` step size of every dimension.
+    """
+
+    def __init__(self, codes: np.ndarray, scale: np.ndarray):
+        self.codes = codes
+        self.scale = scale
+
+    def __len__(self) -> int:
+        return len(self.codes)
+
+    @classmethod
+    def encode(cls, embs: np.ndarray) -> "Int8Codes":
+        absmax = np.zeros(embs.shape[1], dtype=np.float32)
+        for start in range(0, len(embs), _ASSIGN_BLOCK):
+            block = np.abs(np.asarray(embs[start:start + _ASSIGN_BLOCK], dtype=np.float32))
+            np.maximum(absmax, block.max(axis=0), out=absmax)
+        scale = np.where(absmax > 0, absmax / 127, 1).astype(np.float32)
+        codes = np.empty(embs.shape, dtype=np.int8)
+        for start in range(0, len(embs), _ASSIGN_BLOCK):
+            block = np.asarray(embs[start:start + _ASSIGN_BLOCK], dtype=np.float32)
+            codes[start:start + len(block)] = np.clip(np.rint(block / scale), -127, 127)
+        return cls(codes, scale)
+
+    def scores(self, query: np.ndarray, rows: np.ndarray | None = None) -> np.ndarray:
+        """Approximate inner products of ``query`` with all (or the given) rows."""
+        q = (np.asarray(query, dtype=np.float32) * self.scale).astype(np.float32)
+        n = len(self.codes) if rows is None else len(rows)
+        out = np.empty(n, dtype=np.float32)
+        # widen small blocks into a reused buffer that stays in cache
+        buf = np.empty((_INT8_BLOCK, self.codes.shape[1]), dtype=np.float32)
+        for start in range(0, n, _INT8_BLOCK):
+            stop = min(n, start + _INT8_BLOCK)
+            block = self.codes[start:stop] if rows is None else self.codes[rows[start:stop]]
+            np.copyto(buf[:stop - start], block, casting="unsafe")
+            np.matmul(buf[:stop - start], q, out=out[start:stop])
+        return out
+
+    def save(self, path: Path):
+        save_npy(path, self.codes)
+        save_npy(path.with_name(path.stem + ".scale.npy"), self.scale)
+
+    @classmethod
+    def load(cls, path: Path, dim: int) -> "Int8Codes":
+        codes = cls(np.load(path, mmap_mode="r"), np.load(path.with_name(path.stem + ".scale.npy")))
+        if codes.scale.shape != (dim,):
+            raise ValueError(f"{path} holds codes of another dimension")
+        return codes
+
+
+class BinaryCodes:
+    """
+    Sign codes: one bit per dimension, packed eight to a byte.
+
+    Similarity is approximated by the number of matching sign bits between
+    the query and a document, ``dim - 2 * hamming_distance``.
+
+    Attributes
+    ----------
+    bits : np.ndarray
+        uint8 ``(n, ceil(dim / 8))`` packed sign bits.
+    dim : int
+        Number of dimensions of the original vectors.
+    """
+
+    def __init__(self, bits: np.ndarray, dim: int):
+        self.bits = bits
+        self.dim = dim
+
+    def __len__(self) -> int:
+        return len(self.bits)
+
+    @classmethod
+    def encode(cls, embs: np.ndarray) -> "BinaryCodes":
+        bits = np.empty((len(embs), (embs.shape[1] + 7) // 8), dtype=np.uint8)
+        for start in range(0, len(embs), _ASSIGN_BLOCK):
+            block = np.asarray(embs[start:start + _ASSIGN_BLOCK])
+            bits[start:start + len(block)] = np.packbits(block > 0, axis=1)
+        return cls(bits, embs.shape[1])
+
+    def scores(self, query: np.ndarray, rows: np.ndarray | None = None) -> np.ndarray:
+        """Approximate similarities of ``query`` with all (or the given) rows."""
+        q = np.packbits(np.asarray(query) > 0)
+        # popcount on 64-bit words when the rows allow it
+        width = self.bits.shape[1]
+        word = np.uint64 if width % 8 == 0 else np.uint8
+        q = q.view(word)
+        n = len(self.bits) if rows is None else len(rows)
+        out = np.empty(n, dtype=np.float32)
+        for start in range(0, n, _ASSIGN_BLOCK):
+            stop = min(n, start + _ASSIGN_BLOCK)
+            block = self.bits[start:stop] if rows is None else self.bits[rows[start:stop]]
+            block = np.ascontiguousarray(block).view(word)
+            hamming = np.bitwise_count(block ^ q).sum(axis=1, dtype=np.int32)
+            out[start:stop] = self.dim - 2 * hamming
+        return out
+
+    def save(self, path: Path):
+        save_npy(path, self.bits)
+
+    @classmethod
+    def load(cls, path: Path, dim: int) -> "BinaryCodes":
+        bits = np.load(path, mmap_mode="r")
+        if bits.shape[1:] != ((dim + 7) // 8,):
+            raise ValueError(f"{path} holds codes of another dimension")
+        return cls(bits, dim)
+
+
+_QUANTIZERS = {"int8": Int8Codes, "binary": BinaryCodes}
+
+
+def _shortlist(approx: np.ndarray, size: int) -> np.ndarray:
+    """Positions of the ``size`` highest approximate scores, ascending."""
+    if len(approx) <= size:
+        return np.arange(len(approx))
+    return np.sort(np.argpartition(-approx, size - 1)[:size])
+
+
+def _search(embs: np.ndarray, query: np.ndarray, k: int, codes, rescore: int,
+            rows: np.ndarray | None = None) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Exact top ``k`` over all (or the given ascending) rows of ``embs``.
+
+    With ``codes``, only the ``rescore * k`` best rows by approximate score
+    are scored exactly.
+    """
+    if codes is not None and k > 0:
+        short = _shortlist(codes.scores(query, rows), rescore * k)
+        rows = short if rows is None else rows[short]
+    if rows is None:
+        sims = embs @ query
+        idxs = top_k_indices(sims, k)
+        return idxs, sims[idxs]
+    sims = embs[rows] @ query
+    best = top_k_indices(sims, k)
+    return rows[best].astype(np.int64), sims[best]
+
+
+class FlatIndex:
+    """
+    Maximum inner product search over all vectors.
+
+    Exact unless ``codes`` are given, in which case only the shortlist
+    picked by the code scan is scored with the float vectors.
+
+    Attributes
+    ----------
+    embs : np.ndarray
+        Corpus matrix, one row per document.
+    codes : Int8Codes | BinaryCodes | None
+        Quantized vectors for a first-pass scan, if any.
+    rescore : int
+        Shortlist size, in multiples of ``k``, rescored with ``embs``.
+    """
+
+    def __init__(self, embs: np.ndarray, codes=None, rescore: int = 8):
+        self.embs = embs
+        self.codes = codes
+        self.rescore = rescore
+
+    def search(self, query: np.ndarray, k: int) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Return the ``k`` documents with the highest positive similarity.
+
+        Returns
+        -------
+        tuple[np.ndarray, np.ndarray]
+            Document indices by descending similarity, and their similarities.
+        """
+        return _search(self.embs, query, k, self.codes, self.rescore)
+
+
+class IVFIndex:
+    """
+    Inverted file index: vectors grouped by their nearest centroid.
+
+    Attributes
+    ----------
+    embs : np.ndarray
+        Corpus matrix, one row per document.
+    centroids : np.ndarray
+        float32 ``(nlist, dim)`` unit-length cluster centroids.
+    list_ptr : np.ndarray
+        int64 offsets of every cluster into ``list_ids`` (length nlist + 1).
+    list_ids : np.ndarray
+        int32 document indices grouped by cluster, ascending within a cluster.
+    nprobe : int
+        Number of clusters scanned per query.
+    codes : Int8Codes | BinaryCodes | None
+        Quantized vectors for a first-pass scan, if any.
+    rescore : int
+        Shortlist size, in multiples of ``k``, rescored with ``embs``.
+    """
+
+    def __init__(self, embs: np.ndarray, centroids: np.ndarray, list_ptr: np.ndarray,
+                 list_ids: np.ndarray, nprobe: int = 8, codes=None, rescore: int = 8):
+        self.embs = embs
+        self.centroids = centroids
+        self.list_ptr = list_ptr
+        self.list_ids = list_ids
+        self.nprobe = nprobe
+        self.codes = codes
+        self.rescore = rescore
+
+    @property
+    def nlist(self) -> int:
+        return len(self.centroids)
+
+    @classmethod
+    def train(cls, embs: np.ndarray, nlist: int, nprobe: int = 8, codes=None,
+              rescore: int = 8, n_iter: int = 10, seed: int = 0) -> "IVFIndex":
+        """
+        Cluster ``embs`` into ``nlist`` lists with spherical k-means.
+
+        Centroids are trained on a random sample of at most
+        ``256 * nlist`` vectors; every vector is then assigned to the
+        centroid with the highest inner product.
+        """
+        n = len(embs)
+        nlist = max(1, min(nlist, n))
+        rng = np.random.default_rng(seed)
+        sample_size = min(n, nlist * _SAMPLE_PER_LIST)
+        sample = np.asarray(embs[np.sort(rng.choice(n, sample_size, replace=False))], dtype=np.float32)
+
+        centroids = sample[rng.choice(sample_size, nlist, replace=False)].copy()
+        for _ in range(n_iter):
+            assign = _assign(sample, centroids)
+            counts = np.bincount(assign, minlength=nlist)
+            order = np.argsort(assign, kind="stable")
+            starts = np.cumsum(counts) - counts
+            filled = counts > 0
+            centroids[filled] = np.add.reduceat(sample[order], starts[filled], axis=0)
+            # re-seed empty clusters with random sample vectors
+            empty = np.flatnonzero(~filled)
+            if len(empty):
+                centroids[empty] = sample[rng.choice(sample_size, len(empty), replace=False)]
+            centroids = _unit_rows(centroids)
+
+        assign = _assign(embs, centroids)
+        list_ids = np.argsort(assign, kind="stable").astype(np.int32)
+        list_ptr = np.zeros(nlist + 1, dtype=np.int64)
+        np.cumsum(np.bincount(assign, minlength=nlist), out=list_ptr[1:])
+        return cls(embs, centroids, list_ptr, list_ids, nprobe, codes, rescore)
+
+    def search(self, query: np.ndarray, k: int) -> tuple[np.ndarray, np.ndarray]:
+        """Like `FlatIndex.search`, scanning only the ``nprobe`` nearest lists."""
+        nprobe = min(self.nprobe, self.nlist)
+        probe = np.argpartition(-(self.centroids @ query), nprobe - 1)[:nprobe]
+        candidates = np.sort(np.concatenate(
+            [self.list_ids[self.list_ptr[c]:self.list_ptr[c + 1]] for c in probe]
+        ))
+        return _search(self.embs, query, k, self.codes, self.rescore, candidates)
+
+    def save(self, path: Path):
+        """Write the index structure (not the vectors) to ``path`` atomically."""
+        tmp = path.with_name(path.name + ".tmp")
+        with open(tmp, "wb") as f:
+            np.savez(f, centroids=self.centroids, list_ptr=self.list_ptr, list_ids=self.list_ids)
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path: Path, embs: np.ndarray, nprobe: int = 8, codes=None,
+             rescore: int = 8) -> "IVFIndex | None":
+        """Load an index saved by `save` for ``embs``; None if it does not fit."""
+        try:
+            with np.load(path) as data:
+                centroids, list_ptr, list_ids = data["centroids"], data["list_ptr"], data["list_ids"]
+        except (OSError, ValueError, KeyError):
+            return None
+        if len(list_ids) != len(embs) or centroids.shape[1:] != embs.shape[1:]:
+            return None
+        return cls(embs, centroids, list_ptr, list_ids, nprobe, codes, rescore)
+
+
+def _unit_rows(x: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(x, axis=1, keepdims=True)
+    return x / np.where(norms > 0, norms, 1)
+
+
+def _assign(x: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+    """Index of the highest inner product centroid of every row of ``x``."""
+    assign = np.empty(len(x), dtype=np.int64)
+    for start in range(0, len(x), _ASSIGN_BLOCK):
+        block = np.asarray(x[start:start + _ASSIGN_BLOCK], dtype=np.float32)
+        assign[start:start + len(block)] = np.argmax(block @ centroids.T, axis=1)
+    return assign
+
+
+def default_nlist(n: int) -> int:
+    """Common IVF heuristic of about ``4 * sqrt(n)`` clusters."""
+    return max(1, int(4 * math.sqrt(n)))
+
+
+def _load_codes(quantization: str, cache_dir: Path, embs: np.ndarray, token: str):
+    """Map the cached codes of the embedding matrix ``token``, encoding them if needed."""
+    path = cache_dir / f"{quantization}-{token}.npy"
+    quantizer = _QUANTIZERS[quantization]
+    try:
+        codes = quantizer.load(path, embs.shape[1])
+        if len(codes) == len(embs):
+            return codes
+    except (OSError, ValueError):
+        pass
+    print(f"Quantizing {len(embs)} vectors to {quantization} codes...")
+    codes = quantizer.encode(embs)
+    codes.save(path)
+    return codes
+
+
+def load_vector_index(kind: str, cache_dir: Path, embs: np.ndarray, nlist: int = 0,
+                      nprobe: int = 8, quantization: str = "none",
+                      rescore: int = 8) -> FlatIndex | IVFIndex:
+    """
+    Return the vector index of the given ``kind`` over ``embs``.
+
+    Parameters
+    ----------
+    kind : str
+        ``"flat"`` for exact search or ``"ivf"``.
+    cache_dir : Path
+        Embedding cache directory; IVF lists and codes are persisted there.
+    embs : np.ndarray
+        Corpus matrix, as returned by ``load_embeddings``.
+    nlist : int
+        Number of IVF clusters; 0 picks `default_nlist`.
+    nprobe : int
+        Number of IVF clusters scanned per query.
+    quantization : str
+        ``"none"`` to scan the float vectors, ``"int8"`` or ``"binary"`` to
+        scan quantized codes and rescore a shortlist.
+    rescore : int
+        Shortlist size, in multiples of ``k``, when scanning codes.
+    """
+    if kind not in VECTOR_INDEX_KINDS:
+        raise ValueError(f"Unknown vector index {kind!r}, expected one of {VECTOR_INDEX_KINDS}")
+    if quantization not in QUANTIZATIONS:
+        raise ValueError(f"Unknown quantization {quantization!r}, expected one of {QUANTIZATIONS}")
+    if len(embs) == 0:
+        return FlatIndex(embs)
+
+    nlist = min(nlist or default_nlist(len(embs)), len(embs))
+    # the memory-mapped matrix file identifies the embeddings
+    matrix = getattr(embs, "filename", None)
+    if matrix is None:
+        codes = None if quantization == "none" else _QUANTIZERS[quantization].encode(embs)
+        if kind == "flat":
+            return FlatIndex(embs, codes, rescore)
+        return IVFIndex.train(embs, nlist, nprobe, codes, rescore)
+    token = Path(matrix).stem.removeprefix("embeddings-")
+
+    with open(cache_dir / "lock", "w") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        codes = None
+        if quantization != "none":
+            codes = _load_codes(quantization, cache_dir, embs, token)
+        if kind == "flat":
+            index = FlatIndex(embs, codes, rescore)
+        else:
+            path = cache_dir / f"ivf-{nlist}-{token}.npz"
+            index = IVFIndex.load(path, embs, nprobe, codes, rescore)
+            if index is None:
+                print(f"Training IVF index with {nlist} lists over {len(embs)} vectors...")
+                index = IVFIndex.train(embs, nlist, nprobe, codes, rescore)
+                index.save(path)
+            for old in cache_dir.glob("ivf-*.npz"):
+                if old.name != path.name:
+                    old.unlink(missing_ok=True)
+        # drop codes derived from previous embedding matrices
+        for pattern in ("int8-*.npy", "binary-*.npy"):
+            for old in cache_dir.glob(pattern):
+                if token not in old.name:
+                    old.unlink(missing_ok=True)
+    return index
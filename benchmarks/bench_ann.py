@@ -0,0 +1,94 @@
+# Copyright 2025 Leon Hecht
+# Licensed under the Apache License, Version 2.0 (see LICENSE file)
+
+"""
+Recall/latency benchmark for the semantic search vector indexes.
+
+Measures recall@k and query latency of ``IVFIndex`` for several ``nprobe``
+values against exact ``FlatIndex`` search. Vectors are synthetic unit
+vectors drawn around random topic centers, or the cached corpus embeddings
+when ``--embeddings`` points at an ``embeddings-*.npy`` file.
+
+Usage: python -m benchmarks.bench_ann [--n 100000] [--dim 1024] [--nprobe 1 4 8 16 32]
+"""
+
+import argparse
+import time
+import numpy as np
+
+from app.services.vector_index import FlatIndex, IVFIndex, default_nlist
+
+
+def unit_rows(x: np.ndarray) -> np.ndarray:
+    return (x / np.linalg.norm(x, axis=1, keepdims=True)).astype(np.float32)
+
+
+def synthetic_corpus(n: int, dim: int, topics: int, rng: np.random.Generator) -> np.ndarray:
+    """Unit vectors scattered around ``topics`` random centers."""
+    centers = unit_rows(rng.normal(size=(topics, dim)))
+    embs = np.empty((n, dim), dtype=np.float32)
+    for start in range(0, n, 10_000):
+        stop = min(n, start + 10_000)
+        topic = rng.integers(topics, size=stop - start)
+        embs[start:stop] = unit_rows(centers[topic] + rng.normal(scale=0.05, size=(stop - start, dim)))
+    return embs
+
+
+def queries_near(embs: np.ndarray, count: int, rng: np.random.Generator) -> np.ndarray:
+    """Perturbed corpus vectors, so every query has close neighbours."""
+    rows = np.asarray(embs[rng.choice(len(embs), count, replace=False)], dtype=np.float32)
+    return unit_rows(rows + rng.normal(scale=0.02, size=rows.shape))
+
+
+def run(index, queries: np.ndarray, k: int) -> tuple[list[np.ndarray], float]:
+    """Return the results per query and the mean latency in milliseconds."""
+    results = []
+    t0 = time.perf_counter()
+    for q in queries:
+        results.append(index.search(q, k)[0])
+    return results, (time.perf_counter() - t0) / len(queries) * 1000
+
+
+def recall(approx: list[np.ndarray], exact: list[np.ndarray]) -> float:
+    hits = sum(len(np.intersect1d(a, e)) for a, e in zip(approx, exact))
+    return hits / max(1, sum(len(e) for e in exact))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--embeddings", help="cached embeddings-*.npy matrix to use instead of synthetic data")
+    parser.add_argument("--n", type=int, default=100_000)
+    parser.add_argument("--dim", type=int, default=1024)
+    parser.add_argument("--topics", type=int, default=500)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--top-k", type=int, default=30)
+    parser.add_argument("--nlist", type=int, default=0, help="IVF clusters (0 = about 4 * sqrt(n))")
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[1, 4, 8, 16, 32])
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    if args.embeddings:
+        embs = np.load(args.embeddings, mmap_mode="r")
+    else:
+        embs = synthetic_corpus(args.n, args.dim, args.topics, rng)
+    queries = queries_near(embs, min(args.queries, len(embs)), rng)
+    nlist = args.nlist or default_nlist(len(embs))
+
+    exact, flat_ms = run(FlatIndex(embs), queries, args.top_k)
+    t0 = time.perf_counter()
+    ivf = IVFIndex.train(embs, nlist)
+    build_s = time.perf_counter() - t0
+
+    print(f"{len(embs)} vectors x {embs.shape[1]} dims, {len(queries)} queries, k={args.top_k}")
+    print(f"flat: {flat_ms:.3f} ms/query")
+    print(f"ivf:  {ivf.nlist} lists, trained in {build_s:.2f} s")
+    print(f"{'nprobe':>7} {'scanned':>8} {'recall@k':>9} {'ms/query':>9} {'speedup':>8}")
+    for nprobe in args.nprobe:
+        ivf.nprobe = nprobe
+        approx, ms = run(ivf, queries, args.top_k)
+        scanned = min(1.0, nprobe / ivf.nlist)
+        print(f"{nprobe:>7} {scanned:>7.1%} {recall(approx, exact):>9.3f} {ms:>9.3f} {flat_ms / ms:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
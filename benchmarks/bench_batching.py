@@ -0,0 +1,104 @@
+# Copyright 2025 Leon Hecht
+# Licensed under the Apache License, Version 2.0 (see LICENSE file)
+
+"""
+Throughput/latency benchmark for micro-batched query encoding.
+
+Concurrent clients encode distinct queries either one call per query
+(serialized on the model, as before) or through ``MicroBatcher`` with
+different batch windows. By default the model is simulated by a call
+that costs a fixed overhead plus a smaller per-query cost and releases
+the GIL like a torch forward pass; ``--model`` loads BGE-M3 instead.
+
+Usage: python -m benchmarks.bench_batching [--clients 16] [--requests 20] [--wait-ms 0 2 5 10]
+"""
+
+import argparse
+import statistics
+import threading
+import time
+
+import numpy as np
+
+from app.services.batching import MicroBatcher
+
+
+class SimulatedModel:
+    """Encoding cost of ``overhead + per_item * len(texts)`` seconds."""
+
+    def __init__(self, overhead: float, per_item: float):
+        self.overhead = overhead
+        self.per_item = per_item
+
+    def encode(self, texts: list[str]) -> dict:
+        time.sleep(self.overhead + self.per_item * len(texts))
+        return {"dense_vecs": np.zeros((len(texts), 1024), dtype=np.float32)}
+
+
+def load_model(args):
+    if not args.model:
+        return SimulatedModel(args.overhead_ms / 1000, args.per_query_ms / 1000)
+    from FlagEmbedding import BGEM3FlagModel
+    return BGEM3FlagModel("BAAI/bge-m3", use_fp16=True)
+
+
+def run_clients(encode_one, clients: int, requests: int) -> tuple[list[float], float]:
+    """Return every request latency (ms) and the wall time (s)."""
+    latencies: list[float] = []
+    lock = threading.Lock()
+
+    def client(c: int):
+        for r in range(requests):
+            t0 = time.perf_counter()
+            encode_one(f"consulta {c} numero {r} sobre contratos")
+            elapsed = (time.perf_counter() - t0) * 1000
+            with lock:
+                latencies.append(elapsed)
+
+    threads = [threading.Thread(target=client, args=(c,)) for c in range(clients)]
+    t0 = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return latencies, time.perf_counter() - t0
+
+
+def report(label: str, latencies: list[float], wall: float):
+    q = statistics.quantiles(latencies, n=100)
+    print(f"{label:<16} {len(latencies) / wall:>8.1f} {q[49]:>8.1f} {q[94]:>8.1f} {q[98]:>8.1f}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--model", action="store_true", help="encode with BGE-M3 instead of a simulated model")
+    parser.add_argument("--clients", type=int, default=16)
+    parser.add_argument("--requests", type=int, default=20, help="requests per client")
+    parser.add_argument("--max-batch", type=int, default=16)
+    parser.add_argument("--wait-ms", type=float, nargs="+", default=[0, 2, 5, 10])
+    parser.add_argument("--overhead-ms", type=float, default=20.0, help="simulated cost per model call")
+    parser.add_argument("--per-query-ms", type=float, default=2.0, help="simulated cost per query")
+    args = parser.parse_args()
+
+    model = load_model(args)
+    model_lock = threading.Lock()
+
+    def direct(text: str):
+        with model_lock:
+            return model.encode([text])["dense_vecs"][0]
+
+    def encode_batch(texts: list[str]):
+        return model.encode(texts)["dense_vecs"]
+
+    print(f"{args.clients} clients x {args.requests} requests")
+    print(f"{'mode':<16} {'q/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+    report("one per call", *run_clients(direct, args.clients, args.requests))
+    for wait_ms in args.wait_ms:
+        batcher = MicroBatcher(encode_batch, args.max_batch, wait_ms / 1000)
+        latencies, wall = run_clients(batcher, args.clients, args.requests)
+        report(f"batch wait {wait_ms:g}ms", latencies, wall)
+        print(f"{'':<16} mean batch {batcher.stats()['mean_batch']:.1f}")
+
+
+if __name__ == "__main__":
+    main()
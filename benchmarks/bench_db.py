@@ -0,0 +1,113 @@
+# Copyright 2025 Leon Hecht
+# Licensed under the Apache License, Version 2.0 (see LICENSE file)
+
+"""
+Concurrency stress benchmark for the query/feedback store.
+
+Several processes (like uvicorn workers), each with several threads,
+insert ``QueryLog`` and ``Feedback`` rows one transaction at a time into
+a fresh SQLite file. The run is repeated with SQLAlchemy's default engine
+settings and with ``create_db_engine`` (WAL, synchronous=NORMAL, busy
+timeout, explicit pool), reporting writes/sec and failed writes such as
+"database is locked".
+
+Run from the repository root with the app's environment (MODE, ENV).
+
+Usage: python -m benchmarks.bench_db [--processes 4] [--threads 4] [--seconds 5]
+"""
+
+import argparse
+import multiprocessing as mp
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+from sqlalchemy.exc import OperationalError
+from sqlmodel import Session, SQLModel, create_engine
+
+from app.db import create_db_engine
+from app.models.feedback import Feedback
+from app.models.query_log import QueryLog
+
+
+def make_engine(mode: str, url: str):
+    if mode == "default":
+        return create_engine(url)
+    return create_db_engine(url)
+
+
+def worker(mode: str, url: str, threads: int, seconds: float, out: mp.Queue):
+    engine = make_engine(mode, url)
+    counts = {"querylog": 0, "feedback": 0, "errors": 0}
+    lock = threading.Lock()
+    deadline = time.monotonic() + seconds
+
+    def write(t: int):
+        i = 0
+        while time.monotonic() < deadline:
+            if i % 2 == 0:
+                row, kind = QueryLog(client_ip="127.0.0.1", mode="exacta", query=f"consulta {t} {i}"), "querylog"
+            else:
+                row, kind = Feedback(query_log_id=1, document_id=f"doc{i}", positive=True), "feedback"
+            try:
+                with Session(engine) as sess:
+                    sess.add(row)
+                    sess.commit()
+                key = kind
+            except OperationalError:
+                key = "errors"
+            with lock:
+                counts[key] += 1
+            i += 1
+
+    pool = [threading.Thread(target=write, args=(t,)) for t in range(threads)]
+    for t in pool:
+        t.start()
+    for t in pool:
+        t.join()
+    out.put(counts)
+
+
+def run(mode: str, directory: Path, processes: int, threads: int, seconds: float) -> dict:
+    url = f"sqlite:///{directory / f'{mode}.db'}"
+    engine = make_engine(mode, url)
+    SQLModel.metadata.create_all(engine)
+    with Session(engine) as sess:
+        sess.add(QueryLog(client_ip="127.0.0.1", mode="exacta", query="seed"))
+        sess.commit()
+    engine.dispose()
+
+    out: mp.Queue = mp.Queue()
+    procs = [mp.Process(target=worker, args=(mode, url, threads, seconds, out)) for _ in range(processes)]
+    t0 = time.perf_counter()
+    for p in procs:
+        p.start()
+    totals = {"querylog": 0, "feedback": 0, "errors": 0}
+    for _ in procs:
+        for key, value in out.get().items():
+            totals[key] += value
+    for p in procs:
+        p.join()
+    totals["seconds"] = time.perf_counter() - t0
+    return totals
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--processes", type=int, default=4)
+    parser.add_argument("--threads", type=int, default=4)
+    parser.add_argument("--seconds", type=float, default=5.0)
+    args = parser.parse_args()
+
+    print(f"{args.processes} processes x {args.threads} threads, {args.seconds:g} s per run")
+    print(f"{'engine':<8} {'QueryLog/s':>11} {'Feedback/s':>11} {'total/s':>8} {'errors':>7}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for mode in ("default", "tuned"):
+            r = run(mode, Path(tmp), args.processes, args.threads, args.seconds)
+            ql, fb = r["querylog"] / r["seconds"], r["feedback"] / r["seconds"]
+            print(f"{mode:<8} {ql:>11.1f} {fb:>11.1f} {ql + fb:>8.1f} {r['errors']:>7}")
+
+
+if __name__ == "__main__":
+    main()
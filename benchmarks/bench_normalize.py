@@ -0,0 +1,88 @@
+# Copyright 2025 Leon Hecht
+# Licensed under the Apache License, Version 2.0 (see LICENSE file)
+
+"""
+Token normalization throughput, before and after the shared pipeline.
+
+"before" is the per-token implementation the services used to run
+(NFD + per-character category filter + ``re.sub`` for every word);
+"after" is ``normalize_tokens`` applied to whole documents. Both must
+produce identical tokens. The sample is the first ``--docs`` documents of
+a ``corpus.jsonl`` or, without ``--corpus``, synthetic Spanish legal text.
+
+Usage: python -m benchmarks.bench_normalize [--corpus data/static_corpus/corpus.jsonl]
+"""
+
+import argparse
+import json
+import random
+import re
+import time
+import unicodedata
+from pathlib import Path
+
+from app.services.normalize import normalize_token, normalize_tokens
+
+_WORDS = (
+    "el la de que los recurso casación sentencia tribunal apelación acción "
+    "señor juez año demanda resolución artículo Nº 1.234/2019 Asunción "
+    "CORTE SUPREMA DE JUSTICIA considerando: «fundamentos» pág. §12 expediente"
+).split()
+
+
+def legacy_normalize_token(tok: str) -> str:
+    tok = ''.join(
+        c for c in unicodedata.normalize('NFD', tok.lower())
+        if unicodedata.category(c) != 'Mn'
+    )
+    return re.sub(r'[^a-zA-Z]', '', tok)
+
+
+def sample_texts(corpus: str | None, n_docs: int) -> list[str]:
+    if corpus:
+        texts = []
+        with Path(corpus).open(encoding="utf-8") as f:
+            for line in f:
+                obj = json.loads(line)
+                texts.append(f"{obj.get('title', '')} {obj.get('text', '')}".strip())
+                if len(texts) == n_docs:
+                    break
+        return texts
+    rng = random.Random(0)
+    return [" ".join(rng.choices(_WORDS, k=rng.randint(200, 3000))) for _ in range(n_docs)]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--corpus", help="corpus.jsonl to sample documents from")
+    parser.add_argument("--docs", type=int, default=500)
+    args = parser.parse_args()
+
+    texts = sample_texts(args.corpus, args.docs)
+    n_tokens = sum(len(t.split()) for t in texts)
+
+    t0 = time.perf_counter()
+    before = [[legacy_normalize_token(w) for w in t.split()] for t in texts]
+    t_before = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    after = [normalize_tokens(t) for t in texts]
+    t_after = time.perf_counter() - t0
+    assert before == after, "normalized tokens differ"
+
+    # query-time path: repeated tokens hit the LRU memo
+    normalize_token.cache_clear()
+    words = [w for t in texts[:50] for w in t.split()]
+    t0 = time.perf_counter()
+    for w in words:
+        normalize_token(w)
+    t_memo = time.perf_counter() - t0
+
+    print(f"documents: {len(texts)}, tokens: {n_tokens}")
+    print(f"before (per token):      {n_tokens / t_before:>14,.0f} tokens/s")
+    print(f"after (whole document):  {n_tokens / t_after:>14,.0f} tokens/s  ({t_before / t_after:.1f}x)")
+    print(f"memoized normalize_token:{len(words) / t_memo:>14,.0f} tokens/s  {normalize_token.cache_info()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+# Copyright 2025 Leon Hecht
+# Licensed under the Apache License, Version 2.0 (see LICENSE file)
+
+"""
+Recall/latency/memory benchmark for quantized semantic search.
+
+Compares a first-pass scan over int8 or binary codes, followed by exact
+rescoring of a ``rescore * k`` shortlist, against the float32 flat scan.
+Uses the same synthetic vectors (or ``--embeddings`` matrix) and queries as
+``bench_ann``.
+
+Usage: python -m benchmarks.bench_quantization [--n 100000] [--dim 1024] [--rescore 2 4 8 16]
+"""
+
+import argparse
+import time
+import numpy as np
+
+from app.services.vector_index import BinaryCodes, FlatIndex, Int8Codes
+from benchmarks.bench_ann import queries_near, recall, run, synthetic_corpus
+
+
+def code_bytes(codes) -> int:
+    if isinstance(codes, Int8Codes):
+        return codes.codes.nbytes + codes.scale.nbytes
+    return codes.bits.nbytes
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--embeddings", help="cached embeddings-*.npy matrix to use instead of synthetic data")
+    parser.add_argument("--n", type=int, default=100_000)
+    parser.add_argument("--dim", type=int, default=1024)
+    parser.add_argument("--topics", type=int, default=500)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--top-k", type=int, default=30)
+    parser.add_argument("--rescore", type=int, nargs="+", default=[2, 4, 8, 16])
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    if args.embeddings:
+        embs = np.load(args.embeddings)
+    else:
+        embs = synthetic_corpus(args.n, args.dim, args.topics, rng)
+    queries = queries_near(embs, min(args.queries, len(embs)), rng)
+
+    exact, flat_ms = run(FlatIndex(embs), queries, args.top_k)
+    print(f"{len(embs)} vectors x {embs.shape[1]} dims, {len(queries)} queries, k={args.top_k}")
+    print(f"float32: {embs.nbytes / 2**20:.1f} MiB, {flat_ms:.3f} ms/query")
+    print(f"{'codes':<7} {'MiB':>7} {'smaller':>8} {'rescore':>8} {'recall@k':>9} {'ms/query':>9} {'speedup':>8}")
+    for quantizer in (Int8Codes, BinaryCodes):
+        t0 = time.perf_counter()
+        codes = quantizer.encode(embs)
+        encode_s = time.perf_counter() - t0
+        size = code_bytes(codes)
+        for rescore in args.rescore:
+            approx, ms = run(FlatIndex(embs, codes, rescore), queries, args.top_k)
+            print(f"{quantizer.__name__[:-5].lower():<7} {size / 2**20:>7.1f} {embs.nbytes / size:>7.1f}x "
+                  f"{rescore:>8} {recall(approx, exact):>9.3f} {ms:>9.3f} {flat_ms / ms:>7.1f}x")
+        print(f"        encoded in {encode_s:.2f} s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,263 @@
+# Copyright 2025 Leon Hecht
+# Licensed under the Apache License, Version 2.0 (see LICENSE file)
+
+"""
+End-to-end latency/throughput benchmark of the search functions.
+
+The corpus is either synthetic (``--docs`` documents drawn from a Zipfian
+vocabulary, reproducible with ``--seed``) or an existing ``corpus.jsonl``
+(``--corpus``). It is placed in a scratch directory, so indexes are built
+from scratch and the repository's snapshots and caches are left alone;
+``--in-place`` benchmarks the configured corpus with its caches instead.
+
+Queries are replayed from a file (``--queries``: JSONL objects with a
+``query`` field, or one query per line), from the ``QueryLog`` table
+(``--queries-db``), or sampled from the corpus. Every mode is run at
+each concurrency level by a thread pool, like the search pool of the
+server, and reports p50/p95/p99 latency and QPS. Index build times and
+the peak RSS of the process are recorded as well; ``--output`` writes
+everything as JSON for comparing runs between commits.
+
+The result cache is disabled unless ``RESULT_CACHE_SIZE`` is set; all
+other tuning variables of the app apply as usual.
+
+Usage: python -m benchmarks.bench_search [--docs 20000] [--modes bm25 transformer]
+       [--concurrency 1 4 16] [--requests 500] [--output run.json]
+"""
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import numpy as np
+
+from benchmarks._common import peak_rss_bytes
+
+MODES = ("bm25", "transformer", "hybrid", "sparse")
+# environment variables recorded with the results
+_TUNING_PREFIXES = ("VECTOR_", "IVF_", "QUERY_", "RESULT_", "SEARCH_", "HYBRID_", "SPARSE_", "INGEST_")
+
+
+def git_commit() -> str | None:
+    try:
+        out = subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True)
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return out.stdout.strip()
+
+
+def write_synthetic_corpus(path: Path, docs: int, words: int, vocab: int, seed: int):
+    """Write ``docs`` JSONL documents of about ``words`` Zipf-distributed words."""
+    rng = np.random.default_rng(seed)
+    letters = np.array(list("abcdefghijklmnopqrstuvwxyzáéíóúñ"))
+    lengths = rng.integers(3, 12, size=vocab)
+    lexicon = ["".join(rng.choice(letters, size=n)) for n in lengths]
+    with path.open("w", encoding="utf-8") as f:
+        for i in range(docs):
+            n = max(1, int(rng.normal(words, words / 4)))
+            ids = (rng.zipf(1.1, size=n) - 1) % vocab
+            text = " ".join(lexicon[j] for j in ids)
+            title = " ".join(lexicon[j] for j in ids[:6])
+            f.write(json.dumps({"id": f"doc{i}", "title": title, "text": text}, ensure_ascii=False) + "\n")
+
+
+def read_query_file(path: Path) -> list[str]:
+    queries = []
+    with path.open(encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            if line.startswith("{"):
+                query = json.loads(line).get("query")
+                if query:
+                    queries.append(query)
+            else:
+                queries.append(line)
+    return queries
+
+
+def read_query_db(url: str, limit: int) -> list[str]:
+    """Distinct logged queries, most frequent first, streamed from the database."""
+    from sqlalchemy import func
+    from sqlmodel import Session, create_engine, select
+    from app.models.query_log import QueryLog
+
+    engine = create_engine(url)
+    stmt = (
+        select(QueryLog.query)
+        .group_by(QueryLog.query)
+        .order_by(func.count().desc(), QueryLog.query)
+        .limit(limit)
+        .execution_options(yield_per=1000)
+    )
+    with Session(engine) as sess:
+        queries = [q for q in sess.exec(stmt) if q.strip()]
+    engine.dispose()
+    return queries
+
+
+def sample_queries(corpus: list[dict], count: int, seed: int) -> list[str]:
+    """One to three consecutive words of random documents."""
+    rng = np.random.default_rng(seed)
+    queries = []
+    for i in rng.integers(len(corpus), size=count):
+        words = corpus[i]["text"].split()
+        n = int(rng.integers(1, 4))
+        start = int(rng.integers(max(1, len(words) - n + 1)))
+        queries.append(" ".join(words[start:start + n]))
+    return queries
+
+
+def replay(search, queries: list[str], concurrency: int, requests: int, top_k: int) -> dict:
+    """Run ``requests`` searches from ``concurrency`` threads and summarize them."""
+    jobs = [queries[i % len(queries)] for i in range(requests)]
+
+    def timed(query: str) -> float | None:
+        start = time.perf_counter()
+        try:
+            search(query, top_k=top_k)
+        except Exception:
+            return None
+        return time.perf_counter() - start
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        start = time.perf_counter()
+        latencies = list(pool.map(timed, jobs))
+        wall = time.perf_counter() - start
+    ok = np.array([t for t in latencies if t is not None]) * 1000
+    p50, p95, p99 = np.percentile(ok, [50, 95, 99]) if len(ok) else (float("nan"),) * 3
+    return {
+        "concurrency": concurrency,
+        "requests": requests,
+        "errors": requests - len(ok),
+        "qps": len(ok) / wall,
+        "mean_ms": float(ok.mean()) if len(ok) else float("nan"),
+        "p50_ms": float(p50),
+        "p95_ms": float(p95),
+        "p99_ms": float(p99),
+    }
+
+
+def prepare_corpus(args, workdir: Path):
+    """Put the benchmark corpus where the app looks for it, relative to ``workdir``."""
+    corpus_dir = workdir / ("data/static_corpus" if os.environ["MODE"] == "thesis" else "data/uploads")
+    corpus_dir.mkdir(parents=True, exist_ok=True)
+    (corpus_dir / "files").mkdir(exist_ok=True)
+    if args.corpus:
+        src = Path(args.corpus).resolve()
+        if src.is_dir():
+            src = src / "corpus.jsonl"
+        (corpus_dir / "corpus.jsonl").symlink_to(src)
+        return {"source": str(src)}
+    write_synthetic_corpus(corpus_dir / "corpus.jsonl", args.docs, args.doc_words, args.vocab, args.seed)
+    return {"source": "synthetic", "docs": args.docs, "doc_words": args.doc_words, "vocab": args.vocab, "seed": args.seed}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    source = parser.add_mutually_exclusive_group()
+    source.add_argument("--corpus", help="corpus.jsonl (or its directory) instead of a synthetic corpus")
+    source.add_argument("--in-place", action="store_true", help="use the configured corpus and its caches")
+    parser.add_argument("--docs", type=int, default=20_000, help="synthetic corpus size")
+    parser.add_argument("--doc-words", type=int, default=200)
+    parser.add_argument("--vocab", type=int, default=50_000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--queries", help="query file: JSONL with a 'query' field or one query per line")
+    parser.add_argument("--queries-db", help="SQLAlchemy URL of a database with a QueryLog table")
+    parser.add_argument("--max-queries", type=int, default=1000)
+    parser.add_argument("--modes", nargs="+", choices=MODES, default=["bm25"])
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16])
+    parser.add_argument("--requests", type=int, default=500, help="searches per mode and concurrency level")
+    parser.add_argument("--top-k", type=int, default=30)
+    parser.add_argument("--output", help="write the results as JSON to this file ('-' for stdout)")
+    args = parser.parse_args()
+
+    os.environ.setdefault("MODE", "public")
+    os.environ.setdefault("ENV", "dev")
+    os.environ.setdefault("RESULT_CACHE_SIZE", "0")
+    queries = []
+    if args.queries:
+        queries = read_query_file(Path(args.queries))[:args.max_queries]
+    elif args.queries_db:
+        queries = read_query_db(args.queries_db, args.max_queries)
+    output = Path(args.output).resolve() if args.output and args.output != "-" else args.output
+    report_stream = sys.stdout
+    if output == "-":
+        # keep stdout for the report; the app prints its progress there
+        sys.stdout = sys.stderr
+    commit = git_commit()
+
+    with tempfile.TemporaryDirectory(prefix="bench_search_") as tmp:
+        corpus_info = {"source": "in-place"}
+        if not args.in_place:
+            corpus_info = prepare_corpus(args, Path(tmp))
+            # the app resolves its corpus path relative to the working directory
+            os.chdir(tmp)
+
+        build = {}
+        start = time.perf_counter()
+        from app.services import bm25
+        build["bm25_build_seconds"] = time.perf_counter() - start
+        corpus = bm25.current_generation().corpus
+        corpus_info["docs"] = len(corpus)
+        start = time.perf_counter()
+        bm25.load_corpus()
+        build["bm25_snapshot_load_seconds"] = time.perf_counter() - start
+        searches = {"bm25": bm25.bm25_search}
+        if set(args.modes) - {"bm25"}:
+            from app.services import transformer
+            start = time.perf_counter()
+            transformer.load_transformer_corpus()
+            build["transformer_build_seconds"] = time.perf_counter() - start
+            searches["transformer"] = transformer.transformer_search
+            searches["sparse"] = transformer.sparse_search
+            if "hybrid" in args.modes:
+                from app.services.hybrid import hybrid_search
+                searches["hybrid"] = hybrid_search
+        build["peak_rss_bytes"] = peak_rss_bytes()
+
+        if not queries:
+            queries = sample_queries(corpus, args.max_queries, args.seed)
+        print(f"{corpus_info['docs']} documents, {len(queries)} distinct queries, build {build}", file=sys.stderr)
+
+        results = []
+        for mode in args.modes:
+            for concurrency in args.concurrency:
+                r = {"mode": mode, **replay(searches[mode], queries, concurrency, args.requests, args.top_k)}
+                results.append(r)
+                print(
+                    f"{mode:<12} c={concurrency:<3} {r['qps']:>8.1f} qps  p50 {r['p50_ms']:>7.2f} ms"
+                    f"  p95 {r['p95_ms']:>7.2f} ms  p99 {r['p99_ms']:>7.2f} ms  errors {r['errors']}",
+                    file=sys.stderr,
+                )
+
+    report = {
+        "commit": commit,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "machine": {"python": platform.python_version(), "platform": platform.platform(), "cpus": os.cpu_count()},
+        "env": {k: v for k, v in os.environ.items() if k in ("MODE", "ENV") or k.startswith(_TUNING_PREFIXES)},
+        "args": vars(args),
+        "corpus": corpus_info,
+        "queries": len(queries),
+        "build": build,
+        "results": results,
+        "peak_rss_bytes": peak_rss_bytes(),
+    }
+    if output == "-":
+        json.dump(report, report_stream, indent=2)
+        print(file=report_stream)
+    elif output:
+        output.write_text(json.dumps(report, indent=2), encoding="utf-8")
+        print(f"Wrote {output}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+# Copyright 2025 Leon Hecht
+# Licensed under the Apache License, Version 2.0 (see LICENSE file)
+
+"""
+Micro-benchmark for top-k selection.
+
+Compares the shared ``top_k_indices`` stage against the full sorts the
+search services used before (a Python ``sorted`` for BM25 and
+``np.argsort`` for the transformer path) across corpus sizes.
+
+Usage: python -m benchmarks.bench_topk [--top-k 30] [--repeat 20]
+"""
+
+import argparse
+import time
+import numpy as np
+
+from app.services.ranking import top_k_indices
+
+
+def legacy_bm25(scores: np.ndarray, k: int) -> list[int]:
+    top = sorted(range(len(scores)), key=lambda i: scores[i], reverse=True)
+    return [i for i in top if scores[i] > 0][:k]
+
+
+def legacy_transformer(scores: np.ndarray, k: int) -> list[int]:
+    idxs = np.argsort(-scores)
+    return [i for i in idxs if scores[i] > 0][:k]
+
+
+def bm25_like_scores(n: int, rng: np.random.Generator) -> np.ndarray:
+    """Sparse scores: most documents match no query term and score 0."""
+    scores = np.zeros(n)
+    hits = rng.choice(n, size=max(1, n // 20), replace=False)
+    scores[hits] = rng.gamma(2.0, 3.0, size=len(hits))
+    return scores
+
+
+def dense_like_scores(n: int, rng: np.random.Generator) -> np.ndarray:
+    """Dense cosine-like similarities, nearly all positive."""
+    return rng.normal(0.4, 0.1, size=n).astype(np.float32)
+
+
+def timeit(fn, scores, k, repeat) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn(scores, k)
+        best = min(best, time.perf_counter() - t0)
+    return best * 1000
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--top-k", type=int, default=30)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1_000, 10_000, 100_000, 500_000])
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    print(f"{'scores':<8} {'n':>9} {'legacy ms':>10} {'top-k ms':>10} {'speedup':>8}")
+    for n in args.sizes:
+        for label, make, legacy in (
+            ("bm25", bm25_like_scores, legacy_bm25),
+            ("dense", dense_like_scores, legacy_transformer),
+        ):
+            scores = make(n, rng)
+            assert list(top_k_indices(scores, args.top_k)) == list(legacy_bm25(scores, args.top_k))
+            # the legacy BM25 sort is pure Python; keep it bounded on large inputs
+            repeat = args.repeat if n <= 100_000 else max(1, args.repeat // 10)
+            old = timeit(legacy, scores, args.top_k, repeat)
+            new = timeit(top_k_indices, scores, args.top_k, args.repeat)
+            print(f"{label:<8} {n:>9} {old:>10.3f} {new:>10.3f} {old / new:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
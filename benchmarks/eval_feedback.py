@@ -0,0 +1,270 @@
+# Copyright 2025 Leon Hecht
+# Licensed under the Apache License, Version 2.0 (see LICENSE file)
+
+"""
+Offline relevance/efficiency evaluation from user feedback.
+
+Every search that received feedback becomes a test query: the liked
+documents of a ``QueryLog`` entry are relevant, disliked ones are judged
+non-relevant (a document with both counts as relevant only if most votes
+are likes). The judgments are aggregated by the database and streamed one
+search at a time, so neither table is ever loaded as a whole.
+
+Each query is replayed against every selected system and scored with
+precision@k, nDCG@k (binary gains; unjudged documents count as
+non-relevant) and the share of judged documents in the top k. Systems are
+compared at the ranking level, without snippets, so their latencies are
+directly comparable:
+
+- ``bm25``, ``sparse``: the BM25 and lexical-weight postings,
+- ``flat``, ``ivf`` and their ``-int8`` / ``-binary`` variants: semantic
+  search with exact or IVF indexes over float or quantized vectors,
+  using the configured IVF and rescoring settings,
+- ``hybrid-rrf``, ``hybrid-rerank``: hybrid search over the configured
+  vector index.
+
+Query embeddings are computed once per query, before the systems are
+timed, and reported as ``encode``. Memory is the size of each system's
+index arrays besides the shared embedding matrix, plus the peak RSS.
+
+Run from the repository root with the app's environment (MODE, ENV); the
+semantic systems need the transformer model.
+
+Usage: python -m benchmarks.eval_feedback [--db sqlite:///./queries.db] [--k 10]
+       [--systems bm25 flat ivf flat-int8 hybrid-rrf] [--output eval.json]
+"""
+
+import argparse
+import itertools
+import json
+import math
+import os
+import time
+from pathlib import Path
+
+import numpy as np
+
+os.environ.setdefault("RESULT_CACHE_SIZE", "0")
+
+from sqlalchemy import case, func
+from sqlmodel import Session, create_engine, select
+
+from app.config import CORPUS_PATH, DATABASE_URL, IVF_NLIST, IVF_NPROBE, VECTOR_RESCORE
+from app.models.feedback import Feedback
+from app.models.query_log import QueryLog
+from app.services.normalize import normalize, normalize_token
+from app.services.ranking import top_k_indices
+from benchmarks._common import peak_rss_bytes
+
+DENSE_SYSTEMS = {
+    f"{kind}{'' if quant == 'none' else '-' + quant}": (kind, quant)
+    for kind in ("flat", "ivf")
+    for quant in ("none", "int8", "binary")
+}
+SYSTEMS = ("bm25", "sparse", *DENSE_SYSTEMS, "hybrid-rrf", "hybrid-rerank")
+
+
+def judged_searches(engine, limit: int = 0):
+    """
+    Yield ``(query_log_id, query, mode, {document_id: relevant})`` per judged search.
+
+    The votes are summed per search and document by the database and
+    read in chunks, ordered by search.
+    """
+    likes = func.sum(case((Feedback.positive, 1), else_=0))
+    stmt = (
+        select(QueryLog.id, QueryLog.query, QueryLog.mode, Feedback.document_id, likes, func.count())
+        .join(QueryLog, QueryLog.id == Feedback.query_log_id)
+        .group_by(QueryLog.id, QueryLog.query, QueryLog.mode, Feedback.document_id)
+        .order_by(QueryLog.id)
+        .execution_options(yield_per=1000)
+    )
+    with Session(engine) as sess:
+        rows = sess.exec(stmt)
+        searches = itertools.groupby(rows, key=lambda row: row[0])
+        for log_id, group in itertools.islice(searches, limit or None):
+            group = list(group)
+            judgments = {doc_id: 2 * n_likes > n_votes for _, _, _, doc_id, n_likes, n_votes in group}
+            yield log_id, group[0][1], group[0][2], judgments
+
+
+def precision_at_k(ranked: list[str], judgments: dict, k: int) -> float:
+    return sum(judgments.get(doc_id, False) for doc_id in ranked[:k]) / k
+
+
+def ndcg_at_k(ranked: list[str], judgments: dict, k: int) -> float | None:
+    """Binary-gain nDCG@k, None if the search has no relevant document."""
+    ideal = sum(1 / math.log2(i + 2) for i in range(min(k, sum(judgments.values()))))
+    if not ideal:
+        return None
+    dcg = sum(1 / math.log2(i + 2) for i, doc_id in enumerate(ranked[:k]) if judgments.get(doc_id))
+    return dcg / ideal
+
+
+def array_bytes(*objs, skip=("embs",)) -> int:
+    """Bytes of the numpy arrays held by ``objs`` and their attributes."""
+    total = 0
+    for obj in objs:
+        for name, value in vars(obj).items():
+            if name in skip:
+                continue
+            if isinstance(value, np.ndarray):
+                total += value.nbytes
+            elif hasattr(value, "__dict__") and not callable(value):
+                total += array_bytes(value, skip=skip)
+    return total
+
+
+class Systems:
+    """
+    The retrieval systems under evaluation, sharing one index generation.
+
+    Parameters
+    ----------
+    names : list[str]
+        Systems to build, see ``SYSTEMS``.
+    """
+
+    def __init__(self, names: list[str]):
+        self.names = names
+        self.transformer = None
+        self.vectors = {}
+        self.build_seconds = {}
+        semantic = [n for n in names if n != "bm25"]
+        if semantic:
+            from app.services import transformer
+            from app.services.snapshot import snapshot_root
+            from app.services.vector_index import load_vector_index
+
+            self.transformer = transformer
+            start = time.perf_counter()
+            self.gen, self.default_vectors, self.sparse = transformer.corpus_state()
+            self.build_seconds["embeddings"] = time.perf_counter() - start
+            if "sparse" in names and self.sparse is None:
+                raise SystemExit("The sparse system needs SPARSE_INDEX=1")
+            self.embs = self.default_vectors.embs
+            cache_dir = snapshot_root(CORPUS_PATH) / "embeddings"
+            for name in semantic:
+                if name in DENSE_SYSTEMS:
+                    kind, quant = DENSE_SYSTEMS[name]
+                    start = time.perf_counter()
+                    self.vectors[name] = load_vector_index(
+                        kind, cache_dir, self.embs, IVF_NLIST, IVF_NPROBE, quant, VECTOR_RESCORE,
+                    )
+                    self.build_seconds[name] = time.perf_counter() - start
+        else:
+            from app.services.bm25 import current_generation
+            self.gen = current_generation()
+            self.embs = None
+        self.doc_ids = [doc["id"] for doc in self.gen.corpus]
+
+    def index_bytes(self, name: str) -> int:
+        if name == "bm25":
+            return array_bytes(self.gen.index)
+        if name == "sparse":
+            return array_bytes(self.sparse)
+        if name in DENSE_SYSTEMS:
+            return array_bytes(self.vectors[name])
+        return array_bytes(self.gen.index, self.default_vectors)
+
+    def prepare(self, query: str):
+        """Tokenize and embed ``query`` once; return the encoding time in seconds."""
+        self.q_norm = normalize(query)
+        self.tokens = [tok for tok in (normalize_token(t) for t in self.q_norm.split()) if tok]
+        if self.transformer is None:
+            return 0.0
+        start = time.perf_counter()
+        self.q_emb = self.transformer.encode_query(self.q_norm)
+        if "sparse" in self.names:
+            self.q_sparse = self.transformer.encode_sparse_query(self.q_norm)
+        return time.perf_counter() - start
+
+    def rank(self, name: str, k: int) -> list[str]:
+        """IDs of the top ``k`` documents of system ``name`` for the prepared query."""
+        if name == "bm25":
+            idxs = top_k_indices(self.gen.index.get_scores(self.tokens), k) if self.tokens else []
+        elif name == "sparse":
+            idxs = top_k_indices(self.sparse.get_scores(*self.q_sparse), k)
+        elif name in DENSE_SYSTEMS:
+            idxs, _ = self.vectors[name].search(self.q_emb, k)
+        else:
+            from app.services.hybrid import hybrid_rank
+            fusion = name.removeprefix("hybrid-")
+            idxs, _ = hybrid_rank(self.gen, self.default_vectors, self.q_norm, self.tokens, k, fusion)
+        return [self.doc_ids[i] for i in idxs]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--db", default=DATABASE_URL, help="SQLAlchemy URL of the query/feedback store")
+    parser.add_argument("--systems", nargs="+", choices=SYSTEMS, default=["bm25", "flat", "ivf", "flat-int8", "flat-binary"])
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--limit", type=int, default=0, help="evaluate at most this many searches (0 = all)")
+    parser.add_argument("--output", help="write the results as JSON to this file")
+    args = parser.parse_args()
+
+    systems = Systems(args.systems)
+    latencies = {name: [] for name in args.systems}
+    precision = {name: 0.0 for name in args.systems}
+    judged = {name: 0.0 for name in args.systems}
+    ndcg = {name: [0.0, 0] for name in args.systems}
+    encode_seconds, n_searches = [], 0
+
+    engine = create_engine(args.db)
+    for _, query, _, judgments in judged_searches(engine, args.limit):
+        encode_seconds.append(systems.prepare(query))
+        n_searches += 1
+        for name in args.systems:
+            start = time.perf_counter()
+            ranked = systems.rank(name, args.k)
+            latencies[name].append(time.perf_counter() - start)
+            precision[name] += precision_at_k(ranked, judgments, args.k)
+            judged[name] += sum(doc_id in judgments for doc_id in ranked) / args.k
+            score = ndcg_at_k(ranked, judgments, args.k)
+            if score is not None:
+                ndcg[name][0] += score
+                ndcg[name][1] += 1
+    engine.dispose()
+    if not n_searches:
+        raise SystemExit("No feedback to evaluate")
+
+    results = []
+    for name in args.systems:
+        ms = np.array(latencies[name]) * 1000
+        results.append({
+            "system": name,
+            f"precision@{args.k}": precision[name] / n_searches,
+            f"ndcg@{args.k}": ndcg[name][0] / ndcg[name][1] if ndcg[name][1] else None,
+            f"judged@{args.k}": judged[name] / n_searches,
+            "mean_ms": float(ms.mean()),
+            "p95_ms": float(np.percentile(ms, 95)),
+            "index_bytes": systems.index_bytes(name),
+            "build_seconds": systems.build_seconds.get(name),
+        })
+
+    print(f"{n_searches} judged searches, k={args.k}, mean encode {np.mean(encode_seconds) * 1000:.2f} ms")
+    print(f"{'system':<14} {'P@k':>6} {'nDCG@k':>7} {'judged':>7} {'mean ms':>8} {'p95 ms':>8} {'index MB':>9}")
+    for r in results:
+        ndcg_k = r[f"ndcg@{args.k}"]
+        print(
+            f"{r['system']:<14} {r[f'precision@{args.k}']:>6.3f} {'-' if ndcg_k is None else f'{ndcg_k:.3f}':>7}"
+            f" {r[f'judged@{args.k}']:>7.3f} {r['mean_ms']:>8.2f} {r['p95_ms']:>8.2f} {r['index_bytes'] / 2**20:>9.1f}"
+        )
+
+    if args.output:
+        report = {
+            "args": vars(args),
+            "searches": n_searches,
+            "documents": len(systems.doc_ids),
+            "encode_mean_ms": float(np.mean(encode_seconds) * 1000),
+            "embeddings_bytes": int(systems.embs.nbytes) if systems.embs is not None else 0,
+            "build_seconds": systems.build_seconds,
+            "peak_rss_bytes": peak_rss_bytes(),
+            "results": results,
+        }
+        Path(args.output).write_text(json.dumps(report, indent=2), encoding="utf-8")
+        print(f"Wrote {args.output}")
+
+
+if __name__ == "__main__":
+    main()